@@ -0,0 +1,190 @@
+"""离线基准测试用的napcat服务替身
+
+实现插件用到的OneBot接口和头像下载地址，支持keep-alive，可配置每次调用的延迟和群规模，
+并按接口统计调用次数。同一端口上带 Upgrade: websocket 的请求会切换为正向WebSocket服务，
+按OneBot的 action/params/echo 格式收发，同一连接上的请求并发处理。
+"""
+import asyncio
+import base64
+import hashlib
+import json
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class FakeNapcat:
+    def __init__(self, latency: float = 0.0, group_size: int = 500, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            latency: 每次接口调用的模拟延迟（秒）
+            group_size: 每个群的成员数
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+        """
+        self.latency = latency
+        self.group_size = group_size
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        self.sent_messages: List[dict] = []
+        self._members: Dict[str, list] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._websockets: Set[asyncio.StreamWriter] = set()
+
+    def members(self, group_id: str) -> list:
+        """生成（并缓存）某个群的成员列表，群号不同成员QQ号不重叠"""
+        group_id = str(group_id)
+        if group_id not in self._members:
+            base = int(group_id) * 100000
+            self._members[group_id] = [
+                {
+                    "group_id": int(group_id),
+                    "user_id": base + i,
+                    "nickname": f"用户{base + i}",
+                    "card": f"群名片{i}" if i % 3 == 0 else "",
+                    "role": "owner" if i == 0 else "member",
+                }
+                for i in range(self.group_size)
+            ]
+        return self._members[group_id]
+
+    def reset_counters(self):
+        self.calls.clear()
+        self.sent_messages.clear()
+
+    @property
+    def avatar_url(self) -> str:
+        """插件 avatar.url_template 配置可以使用的头像地址"""
+        return f"http://{self.host}:{self.port}/avatar?nk={{qq}}&s={{size}}"
+
+    def avatar(self, query: str) -> bytes:
+        """生成一张假的头像，大小随尺寸变化"""
+        params = dict(item.partition("=")[::2] for item in query.split("&") if item)
+        return b"\xff\xd8\xff\xe0" + bytes(int(params.get("s", 640)) * 4)
+
+    def handle(self, endpoint: str, payload: dict) -> dict:
+        """处理一次接口调用，返回OneBot格式的响应"""
+        if endpoint == "get_group_member_list":
+            data = self.members(payload["group_id"])
+        elif endpoint == "get_group_info":
+            data = {"group_id": int(payload["group_id"]), "group_name": f"测试群{payload['group_id']}"}
+        elif endpoint == "get_stranger_info":
+            data = {"user_id": int(payload["user_id"]), "nickname": f"用户{payload['user_id']}"}
+        elif endpoint == "get_group_member_info":
+            data = {"user_id": int(payload["user_id"]), "role": "member"}
+        elif endpoint in ("send_group_msg", "send_private_msg", "send_group_forward_msg", "send_private_forward_msg"):
+            self.sent_messages.append({"endpoint": endpoint, **payload})
+            data = {"message_id": len(self.sent_messages)}
+        else:
+            return {"status": "failed", "retcode": 1404, "data": None, "message": f"unknown action {endpoint}"}
+        return {"status": "ok", "retcode": 0, "data": data}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                path = request_line.split()[1].decode()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self._serve_websocket(reader, writer, headers["sec-websocket-key"])
+                    break
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                endpoint, _, query = path.strip("/").partition("?")
+                self.calls[endpoint] += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if endpoint == "avatar":
+                    # 头像下载地址的替身，插件的 avatar.url_template 指向这里
+                    content_type, response = "image/jpeg", self.avatar(query)
+                else:
+                    content_type = "application/json"
+                    response = json.dumps(self.handle(endpoint, json.loads(body or b"{}")), ensure_ascii=False).encode()
+                writer.write(
+                    f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n".encode()
+                    + f"Content-Length: {len(response)}\r\n\r\n".encode()
+                    + response
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def drop_websockets(self):
+        """断开所有WebSocket连接，用于验证插件的断线重连"""
+        for writer in list(self._websockets):
+            writer.transport.abort()
+
+    async def _serve_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, key: str):
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n".encode()
+            + f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        await writer.drain()
+        self._websockets.add(writer)
+        tasks = set()
+        try:
+            while True:
+                first, second = await reader.readexactly(2)
+                opcode, length = first & 0x0F, second & 0x7F
+                if length == 126:
+                    length = int.from_bytes(await reader.readexactly(2), "big")
+                elif length == 127:
+                    length = int.from_bytes(await reader.readexactly(8), "big")
+                mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+                payload = bytes(b ^ mask[i & 3] for i, b in enumerate(await reader.readexactly(length)))
+                if opcode == 0x8:
+                    break
+                if opcode == 0x1:
+                    task = asyncio.create_task(self._ws_action(writer, json.loads(payload)))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        finally:
+            self._websockets.discard(writer)
+            for task in tasks:
+                task.cancel()
+
+    async def _ws_action(self, writer: asyncio.StreamWriter, request: dict):
+        endpoint = request.get("action", "")
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self.handle(endpoint, request.get("params") or {})
+        response["echo"] = request.get("echo")
+        data = json.dumps(response, ensure_ascii=False).encode()
+        # 服务端发出的帧不加掩码
+        if len(data) < 126:
+            head = bytes((0x81, len(data)))
+        elif len(data) < 1 << 16:
+            head = bytes((0x81, 126)) + len(data).to_bytes(2, "big")
+        else:
+            head = bytes((0x81, 127)) + len(data).to_bytes(8, "big")
+        writer.write(head + data)
+        await writer.drain()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # 插件连接池持有keep-alive连接，需要主动断开才能完成关闭
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
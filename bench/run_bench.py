@@ -0,0 +1,197 @@
+"""今日老婆插件离线基准测试
+
+在临时目录中加载 plugin.py（使用 bench/stub 中的 src.plugin_system 替身），
+连接本地的napcat替身服务运行以下场景：
+
+- burst:     零点高峰，所有群的所有用户同时首次抽取
+- repeat:    已抽取用户反复发送命令
+- queryall:  管理员在大群中翻阅今日全部记录
+
+用法:
+    python bench/run_bench.py [--groups 4] [--users 200] [--group-size 2000] [--latency-ms 5]
+
+插件本身依赖的第三方库（如 toml）需要已安装。
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR / "stub"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fake_napcat import FakeNapcat  # noqa: E402
+
+ADMIN_QQ = "10000"
+
+
+def load_plugin(workdir: Path) -> types.ModuleType:
+    """把plugin.py复制到临时目录后加载，数据库文件也会建在该目录中"""
+    shutil.copy(BENCH_DIR.parent / "plugin.py", workdir / "plugin.py")
+    spec = importlib.util.spec_from_file_location(f"jrlp_bench_{workdir.name}", workdir / "plugin.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_message(user_id: str, group_id: Optional[str], text: str) -> types.SimpleNamespace:
+    """构造宿主消息对象中插件用到的字段"""
+    user_info = types.SimpleNamespace(user_id=user_id)
+    chat_stream = types.SimpleNamespace(
+        stream_type="group" if group_id else "private",
+        user_info=user_info,
+        group_info=types.SimpleNamespace(group_id=group_id) if group_id else None,
+    )
+    return types.SimpleNamespace(
+        chat_stream=chat_stream,
+        message_info=types.SimpleNamespace(user_info=user_info),
+        processed_plain_text=text,
+    )
+
+
+class Scenario:
+    def __init__(self, name: str, napcat: FakeNapcat, plugin: types.ModuleType):
+        self.name = name
+        self.napcat = napcat
+        self.plugin = plugin
+        self.latencies: List[float] = []
+        self.failures = 0
+        self.wall = 0.0
+
+    async def run(self, commands: List[Callable], concurrency: int):
+        self.napcat.reset_counters()
+        self.plugin.metrics.reset()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(factory: Callable):
+            async with semaphore:
+                command = factory()
+                start = time.perf_counter()
+                success, _, _ = await command.execute()
+                self.latencies.append(time.perf_counter() - start)
+                if not success:
+                    self.failures += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_one(factory) for factory in commands))
+        self.wall = time.perf_counter() - start
+
+    def report(self) -> Dict:
+        count = len(self.latencies)
+        ordered = sorted(self.latencies)
+        napcat_calls = sum(self.napcat.calls.values())
+        # 数据库耗时取自插件内置的 db.* 统计项
+        db_ms = sum(
+            stats["avg_ms"] * stats["count"]
+            for stage, stats in self.plugin.metrics.snapshot().items()
+            if stage.startswith("db.")
+        )
+        return {
+            "scenario": self.name,
+            "commands": count,
+            "failures": self.failures,
+            "wall_s": round(self.wall, 3),
+            "commands_per_s": round(count / self.wall, 1) if self.wall else 0.0,
+            "p50_ms": round(statistics.median(ordered) * 1000, 2) if ordered else 0.0,
+            "p99_ms": round(ordered[min(count - 1, int(count * 0.99))] * 1000, 2) if ordered else 0.0,
+            "napcat_calls_per_command": round(napcat_calls / count, 2) if count else 0.0,
+            "napcat_calls": dict(self.napcat.calls),
+            "db_ms_total": round(db_ms, 2),
+            "db_ms_per_command": round(db_ms / count, 3) if count else 0.0,
+        }
+
+
+async def run_benchmarks(args) -> List[Dict]:
+    napcat = FakeNapcat(latency=args.latency_ms / 1000, group_size=args.group_size)
+    await napcat.start()
+    workdir = Path(tempfile.mkdtemp(prefix="jrlp_bench_"))
+    try:
+        plugin = load_plugin(workdir)
+        config = {
+            "napcat": {"address": napcat.host, "port": napcat.port, "ws_port": napcat.port},
+            "avatar": {"url_template": napcat.avatar_url},
+            # 测试插件自身的吞吐，不按真实QQ限速；发送队列积压时的合并仍然生效
+            "send": {"rate": 0},
+            "messages": {
+                "already_rolled_text": "你今天已经有群老婆{wife_name}({wife_qq})了，要好好对待她哦~",
+                "new_roll_text": "你今天的群老婆是:{wife_name}({wife_qq})",
+            },
+            "admin": {"enabled": True, "userlist": [ADMIN_QQ]},
+        }
+        for override in args.set or []:
+            key, _, value = override.partition("=")
+            section, _, name = key.partition(".")
+            config.setdefault(section, {})[name] = json.loads(value)
+
+        groups = [str(100 + i) for i in range(args.groups)]
+        users = {group: [str(m["user_id"]) for m in napcat.members(group)[:args.users]] for group in groups}
+
+        def roll(user_id: str, group_id: str) -> Callable:
+            return lambda: plugin.JrlpCommand(make_message(user_id, group_id, "jrlp"), config)
+
+        results = []
+
+        burst = Scenario("burst", napcat, plugin)
+        await burst.run([roll(u, g) for g in groups for u in users[g]], args.concurrency)
+        results.append(burst.report())
+
+        repeat = Scenario("repeat", napcat, plugin)
+        await repeat.run([roll(u, g) for _ in range(args.repeat) for g in groups for u in users[g]], args.concurrency)
+        results.append(repeat.report())
+
+        pages = (args.users + plugin.QUERYALL_PAGE_SIZE - 1) // plugin.QUERYALL_PAGE_SIZE
+        queryall = Scenario("queryall", napcat, plugin)
+        await queryall.run(
+            [
+                (lambda page=page: plugin.JrlpAdminCommand(make_message(ADMIN_QQ, groups[0], f"/jrlp queryall {page}"), config))
+                for page in range(1, pages + 1)
+            ],
+            args.concurrency,
+        )
+        results.append(queryall.report())
+
+        await plugin.JrlpContext.shutdown()
+        return results
+    finally:
+        await napcat.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="今日老婆插件离线基准测试")
+    parser.add_argument("--groups", type=int, default=4, help="群数量")
+    parser.add_argument("--users", type=int, default=200, help="每个群参与抽取的用户数")
+    parser.add_argument("--group-size", type=int, default=2000, help="每个群的成员数")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="napcat每次调用的模拟延迟（毫秒）")
+    parser.add_argument("--concurrency", type=int, default=64, help="同时执行的命令数")
+    parser.add_argument("--repeat", type=int, default=3, help="repeat场景中每个用户重复发送的次数")
+    parser.add_argument("--set", action="append", metavar="SECTION.KEY=JSON",
+                        help="覆盖插件配置，如 --set database.write_behind=true")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(args))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    columns = ["scenario", "commands", "failures", "commands_per_s", "p50_ms", "p99_ms",
+               "napcat_calls_per_command", "db_ms_per_command"]
+    print("  ".join(f"{c:>24}" for c in columns))
+    for result in results:
+        print("  ".join(f"{result[c]!s:>24}" for c in columns))
+    for result in results:
+        print(f"{result['scenario']}: {result['napcat_calls']}")
+
+
+if __name__ == "__main__":
+    main()
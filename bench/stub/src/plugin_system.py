@@ -0,0 +1,95 @@
+"""宿主 src.plugin_system 的最小替身，仅供基准测试离线加载插件使用
+
+只实现插件实际用到的接口，行为与宿主保持一致：
+- 命令组件每条消息实例化一次，通过 get_config 按 "section.key" 读取插件配置
+- send_text 发送的文本记录在 sent_texts 中，便于检查结果
+"""
+import logging
+from typing import Any, List, Optional
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def _get_config(config: dict, key: str, default: Any = None) -> Any:
+    current = config
+    for part in key.split("."):
+        if not isinstance(current, dict) or part not in current:
+            return default
+        current = current[part]
+    return current
+
+
+class ConfigField:
+    def __init__(self, type: type, default: Any, description: str = "", **kwargs):
+        self.type = type
+        self.default = default
+        self.description = description
+
+
+class ComponentInfo:
+    def __init__(self, name: str = ""):
+        self.name = name
+
+
+class EventType:
+    ON_START = "on_start"
+    ON_STOP = "on_stop"
+
+
+def register_plugin(cls):
+    return cls
+
+
+class chat_api:
+    @staticmethod
+    def get_stream_type(chat_stream) -> str:
+        return chat_stream.stream_type
+
+
+class BaseCommand:
+    command_name = ""
+    command_description = ""
+    command_pattern = ""
+
+    def __init__(self, message, plugin_config: Optional[dict] = None):
+        self.message = message
+        self.plugin_config = plugin_config or {}
+        self.sent_texts: List[str] = []
+
+    def get_config(self, key: str, default: Any = None) -> Any:
+        return _get_config(self.plugin_config, key, default)
+
+    async def send_text(self, content: str) -> bool:
+        self.sent_texts.append(content)
+        return True
+
+    @classmethod
+    def get_command_info(cls) -> ComponentInfo:
+        return ComponentInfo(cls.command_name)
+
+
+class BaseEventHandler:
+    event_type = None
+    handler_name = ""
+    handler_description = ""
+
+    def __init__(self, plugin_config: Optional[dict] = None):
+        self.plugin_config = plugin_config or {}
+
+    def get_config(self, key: str, default: Any = None) -> Any:
+        return _get_config(self.plugin_config, key, default)
+
+    @classmethod
+    def get_handler_info(cls) -> ComponentInfo:
+        return ComponentInfo(cls.handler_name)
+
+
+class BasePlugin:
+    def __init__(self, plugin_dir: str = "", config: Optional[dict] = None):
+        self.plugin_dir = plugin_dir
+        self.config = config or {}
+
+    def get_config(self, key: str, default: Any = None) -> Any:
+        return _get_config(self.config, key, default)
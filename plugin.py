@@ -1,16 +1,36 @@
+import asyncio
+import base64
 import sqlite3
 import random
+import threading
+import contextlib
+import csv
 import datetime
+import functools
+import hashlib
+import hmac
+import io
+import itertools
 import json
+import secrets
+import ssl
+import time
+import urllib.parse
+import zlib
 import toml
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Optional, Type, Tuple, List, Union
-from urllib.request import urlopen, Request
-from urllib.error import URLError, HTTPError
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Type, Tuple, List, Union
 
 from src.plugin_system import (
     BaseCommand,
+    BaseEventHandler,
     BasePlugin,
+    EventType,
     register_plugin,
     ConfigField,
     ComponentInfo,
@@ -49,42 +69,702 @@ def _load_command_pattern() -> str:
     # 返回默认值
     return r'^(今日老婆|抽老婆|jrlp)$'
 
+# 每个统计项保留的最近耗时样本数
+METRICS_SAMPLE_SIZE = 2048
+
+
+class StageMetrics:
+    """单个统计项（接口或数据库方法）的调用次数、错误次数和最近耗时样本"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.samples: Deque[float] = deque(maxlen=METRICS_SAMPLE_SIZE)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+
+
+class Metrics:
+    """进程内耗时统计，napcat接口和数据库方法调用时自动记录，线程安全"""
+
+    def __init__(self):
+        self._stages: Dict[str, StageMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, elapsed: float, ok: bool = True):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageMetrics()
+            stats.count += 1
+            stats.total += elapsed
+            stats.samples.append(elapsed)
+            if not ok:
+                stats.errors += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {stage: stats.snapshot() for stage, stats in sorted(self._stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+metrics = Metrics()
+
+
+def _timed(stage: str):
+    """记录被装饰的同步函数的耗时，抛出异常时计为错误"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                metrics.record(stage, time.perf_counter() - start, ok)
+        return wrapper
+    return decorator
+
+
+# napcat请求超时时间（秒）
+NAPCAT_TIMEOUT = 10
+# napcat请求超时时返回的错误信息
+NAPCAT_TIMEOUT_ERROR = "网络错误: 请求超时"
+# 头像下载地址，{qq}为QQ号，{size}为图片尺寸
+AVATAR_URL_TEMPLATE = "https://q1.qlogo.cn/g?b=qq&nk={qq}&s={size}"
+# 下载头像的超时时间（秒）
+AVATAR_FETCH_TIMEOUT = 5
+# 统计表中按天的计数保留的天数，决定 /jrlp top 最多能统计多少天
+STATS_DAILY_DAYS = 30
+# /jrlp top 显示的人数
+STATS_TOP_LIMIT = 10
+# queryall 合并转发时每个消息节点包含的记录数
+QUERYALL_FORWARD_LINES = 50
+# 批量修改结果中最多列出的跳过条目数
+BULK_OVERRIDE_REPORT_LIMIT = 10
+# 每个napcat地址最多同时保持的连接数
+NAPCAT_POOL_SIZE = 8
+# 同一接口连续失败多少次后熔断
+NAPCAT_BREAKER_THRESHOLD = 5
+# 熔断后多少秒放行一次试探请求
+NAPCAT_BREAKER_RESET = 30
+# WebSocket断线重连的初始和最大等待时间（秒），每次失败等待时间翻倍
+WS_RECONNECT_MIN = 0.5
+WS_RECONNECT_MAX = 30
+
+# 当前命令剩余的napcat调用时限（time.monotonic() 截止时间），None表示不限
+_napcat_deadline: ContextVar[Optional[float]] = ContextVar("jrlp_napcat_deadline", default=None)
+
+
+@contextlib.contextmanager
+def napcat_deadline(seconds: float):
+    """为当前命令内的所有napcat调用设置共享的总时限"""
+    token = _napcat_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _napcat_deadline.reset(token)
+
+
+def _detach_deadline():
+    """后台任务不受创建它的命令的时限约束，在任务开始时调用"""
+    _napcat_deadline.set(None)
+
+
+class CircuitBreaker:
+    """单个napcat接口的熔断器
+
+    连续失败达到阈值后熔断（open），期间请求直接失败；经过reset_timeout秒后
+    进入半开状态（half_open）放行一个试探请求，成功则恢复（closed），失败则继续熔断。
+    """
+
+    def __init__(self, failure_threshold: int = NAPCAT_BREAKER_THRESHOLD, reset_timeout: float = NAPCAT_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """当前是否允许发出请求"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self):
+        """请求没有得出结论（被取消或受命令时限提前超时），只归还试探名额"""
+        self._probing = False
+
+    def record(self, success: bool):
+        if success:
+            self.state = "closed"
+            self.failures = 0
+        else:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+        self._probing = False
+
+
+class _StaleConnectionError(ConnectionError):
+    """复用的空闲连接在请求完整发出之前就已失效，对端不可能处理过该请求"""
+
+
+class _HttpConnectionPool:
+    """基于asyncio的HTTP/1.1 keep-alive连接池
+
+    每个napcat地址对应一个连接池，请求完成后连接放回空闲列表供后续请求复用，
+    同时在途的请求数不超过pool_size，超出的请求在信号量上排队等待。
+    """
+
+    def __init__(self, host: str, port: int, pool_size: int = NAPCAT_POOL_SIZE, use_ssl: bool = False):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.use_ssl = use_ssl
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self):
+        # 连接和信号量都绑定在事件循环上，循环变化时（如宿主重启循环）丢弃旧连接
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            for _, writer in self._idle:
+                writer.transport.abort()
+            self._idle.clear()
+            self._semaphore = asyncio.Semaphore(self.pool_size)
+            self._loop = loop
+
+    async def request(self, path: str, body: Optional[bytes], timeout: float,
+                      idempotent: Optional[bool] = None) -> Tuple[int, bytes]:
+        """发送一次请求，有请求体时为POST，否则为GET
+
+        Args:
+            path: 请求路径（可带查询参数）
+            body: 请求体，None表示GET请求
+            timeout: 超时时间（秒），包含排队等待连接的时间
+            idempotent: 请求是否可以重复执行，默认GET可以、POST不可以。
+                不可重复的请求只在请求发出之前发现连接失效时换连接重试，
+                已发出后连接断开时直接失败，避免对端处理过的请求（如发送消息）被执行两次
+
+        Returns:
+            (状态码, 响应体)
+        """
+        self._bind_loop()
+        if idempotent is None:
+            idempotent = body is None
+        return await asyncio.wait_for(self._request(path, body, idempotent), timeout)
+
+    async def _request(self, path: str, body: Optional[bytes], idempotent: bool) -> Tuple[int, bytes]:
+        async with self._semaphore:
+            while self._idle:
+                # 复用空闲连接，对端可能已关闭keep-alive连接，此时换一条连接重试
+                reader, writer = self._idle.pop()
+                try:
+                    return await self._roundtrip(reader, writer, path, body)
+                except _StaleConnectionError:
+                    writer.transport.abort()
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.transport.abort()
+                    if not idempotent:
+                        raise
+                except BaseException:
+                    writer.transport.abort()
+                    raise
+            if self.use_ssl:
+                reader, writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=ssl.create_default_context(), server_hostname=self.host
+                )
+            else:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                return await self._roundtrip(reader, writer, path, body)
+            except BaseException:
+                writer.transport.abort()
+                raise
+
+    async def _roundtrip(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         path: str, body: Optional[bytes]) -> Tuple[int, bytes]:
+        if body is None:
+            head = (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                "Connection: keep-alive\r\n"
+                "\r\n"
+            )
+            body = b""
+        else:
+            head = (
+                f"POST {path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: keep-alive\r\n"
+                "\r\n"
+            )
+        if reader.at_eof():
+            raise _StaleConnectionError("连接已被对端关闭")
+        try:
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError as e:
+            # 请求没有完整发出，对端不会处理
+            raise _StaleConnectionError(str(e)) from e
+
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get("connection", "").lower() != "close"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # 跳过trailer
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b"".join(chunks)
+        elif "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await reader.read()
+            keep_alive = False
+
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, data
+
+
+def _ws_mask(payload: bytes, mask: bytes) -> bytes:
+    """按WebSocket掩码规则对数据逐字节异或，用大整数一次完成"""
+    length = len(payload)
+    if not length:
+        return payload
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+
+
+class _WebSocketTransport:
+    """基于asyncio的OneBot正向WebSocket连接
+
+    所有请求共用一条长连接，每个请求带上递增的echo，响应按echo分发给对应的等待者，
+    因此可以同时有任意多个请求在途。连接断开时所有在途请求立即失败，并在后台按
+    指数退避自动重连，重连期间的新请求等待连接恢复（受各自的超时约束）。
+    没有echo的消息（napcat推送的事件）直接丢弃。
+    """
+
+    _GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def __init__(self, host: str, port: int, path: str = "/"):
+        self.host = host
+        self.port = port
+        self.path = path or "/"
+        self.reconnects = 0
+        self._echo = itertools.count(1)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self):
+        # 连接绑定在事件循环上，循环变化时（如宿主重启循环）丢弃旧连接
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._writer is not None:
+                self._writer.transport.abort()
+            self._writer = None
+            self._pending.clear()
+            self._connected = asyncio.Event()
+            self._write_lock = asyncio.Lock()
+            self._reader_task = self._reconnect_task = None
+            self._loop = loop
+
+    async def request(self, action: str, params: dict, timeout: float) -> dict:
+        """发送一次OneBot动作请求
+
+        Args:
+            action: 动作名，如 get_group_info
+            params: 动作参数
+            timeout: 超时时间（秒），包含等待重连的时间
+
+        Returns:
+            napcat返回的完整响应（含status、retcode、data）
+        """
+        self._bind_loop()
+        return await asyncio.wait_for(self._request(action, params), timeout)
+
+    async def _request(self, action: str, params: dict) -> dict:
+        if not self._connected.is_set():
+            self._start_reconnect()
+            await self._connected.wait()
+
+        echo = str(next(self._echo))
+        future = asyncio.get_running_loop().create_future()
+        self._pending[echo] = future
+        try:
+            data = json.dumps({"action": action, "params": params, "echo": echo}, ensure_ascii=False)
+            await self._send_frame(0x1, data.encode("utf-8"))
+            return await future
+        finally:
+            self._pending.pop(echo, None)
+
+    def _start_reconnect(self):
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        delay = WS_RECONNECT_MIN
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(self._handshake(), NAPCAT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                    ValueError, IndexError) as e:
+                logger.warning(f"连接napcat WebSocket失败，{delay:.1f}秒后重试: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, WS_RECONNECT_MAX)
+                continue
+            self._writer = writer
+            self._reader_task = asyncio.create_task(self._read_loop(reader, writer))
+            self._connected.set()
+            return
+
+    async def _handshake(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            key = base64.b64encode(secrets.token_bytes(16)).decode("ascii")
+            writer.write((
+                f"GET {self.path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n"
+                "\r\n"
+            ).encode("latin-1"))
+            await writer.drain()
+
+            status_line = await reader.readuntil(b"\r\n")
+            headers = {}
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            expected = base64.b64encode(hashlib.sha1((key + self._GUID).encode("ascii")).digest()).decode("ascii")
+            if status_line.split()[1] != b"101" or headers.get("sec-websocket-accept") != expected:
+                raise ValueError(f"握手失败: {status_line.decode('latin-1').strip()}")
+            return reader, writer
+        except BaseException:
+            writer.transport.abort()
+            raise
+
+    async def _send_frame(self, opcode: int, payload: bytes):
+        # 客户端发出的帧必须加掩码
+        length = len(payload)
+        if length < 126:
+            head = bytes((0x80 | opcode, 0x80 | length))
+        elif length < 1 << 16:
+            head = bytes((0x80 | opcode, 0x80 | 126)) + length.to_bytes(2, "big")
+        else:
+            head = bytes((0x80 | opcode, 0x80 | 127)) + length.to_bytes(8, "big")
+        mask = secrets.token_bytes(4)
+        masked = _ws_mask(payload, mask)
+        async with self._write_lock:
+            writer = self._writer
+            if writer is None:
+                raise ConnectionError("WebSocket连接已断开")
+            writer.write(head + mask + masked)
+            await writer.drain()
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        error: BaseException = ConnectionError("WebSocket连接已断开")
+        try:
+            message = bytearray()
+            while True:
+                first, second = await reader.readexactly(2)
+                opcode, length = first & 0x0F, second & 0x7F
+                if length == 126:
+                    length = int.from_bytes(await reader.readexactly(2), "big")
+                elif length == 127:
+                    length = int.from_bytes(await reader.readexactly(8), "big")
+                mask = await reader.readexactly(4) if second & 0x80 else None
+                payload = await reader.readexactly(length)
+                if mask:
+                    payload = _ws_mask(payload, mask)
+
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    await self._send_frame(0xA, payload)
+                    continue
+                if opcode in (0x0, 0x1, 0x2):
+                    # 分片的消息拼接完整后再处理
+                    message += payload
+                    if first & 0x80:
+                        self._dispatch(bytes(message))
+                        message.clear()
+        except (ConnectionError, asyncio.IncompleteReadError, OSError) as e:
+            error = ConnectionError(f"WebSocket连接已断开: {e}")
+        except asyncio.CancelledError:
+            writer.transport.abort()
+            raise
+        finally:
+            if self._writer is writer:
+                self._writer = None
+                self._connected.clear()
+            writer.transport.abort()
+
+        # 在途请求全部失败，后台开始重连
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.reconnects += 1
+        self._start_reconnect()
+
+    async def close(self):
+        """断开连接并停止重连，在途请求全部失败"""
+        for task in (self._reconnect_task, self._reader_task):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self._writer is not None:
+            self._writer.transport.abort()
+            self._writer = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("WebSocket连接已关闭"))
+        self._pending.clear()
+        self._loop = None
+
+    def _dispatch(self, message: bytes):
+        try:
+            data = json.loads(message.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return
+        if not isinstance(data, dict):
+            return
+        future = self._pending.get(str(data.get("echo")))
+        if future is not None and not future.done():
+            future.set_result(data)
+
+
 # Napcat API调用类
 class NapcatAPI:
+    # 按 (地址, 端口) 复用的连接池
+    _pools: Dict[Tuple[str, int], _HttpConnectionPool] = {}
+    # 与napcat通信的方式，http 或 websocket，由 configure 设置
+    transport = "http"
+    ws_port = 3001
+    ws_path = "/"
+    # 按 (地址, WebSocket端口) 复用的长连接
+    _websockets: Dict[Tuple[str, int], _WebSocketTransport] = {}
+    # 按 (地址, 端口, 接口名) 区分的熔断器
+    _breakers: Dict[Tuple[str, int, str], CircuitBreaker] = {}
+    # 可以合并的只读接口
+    READ_ENDPOINTS = frozenset({"get_group_member_list", "get_group_info", "get_stranger_info", "get_group_member_info"})
+    # 进行中的只读请求，按 (地址, 端口, 接口名, 请求数据) 区分
+    _inflight: Dict[Tuple[str, int, str, str], "asyncio.Future"] = {}
+    # 合并到已有请求的次数
+    coalesced = 0
+
+    @classmethod
+    def _get_pool(cls, address: str, port: int) -> _HttpConnectionPool:
+        key = (address, int(port))
+        pool = cls._pools.get(key)
+        if pool is None:
+            pool = cls._pools[key] = _HttpConnectionPool(address, int(port))
+        return pool
+
+    @classmethod
+    def _get_websocket(cls, address: str) -> _WebSocketTransport:
+        key = (address, int(cls.ws_port))
+        connection = cls._websockets.get(key)
+        if connection is None:
+            connection = cls._websockets[key] = _WebSocketTransport(address, int(cls.ws_port), cls.ws_path)
+        return connection
+
+    @classmethod
+    def configure(cls, transport: str = "http", ws_port: int = 3001, ws_path: str = "/"):
+        """设置与napcat通信的方式
+
+        Args:
+            transport: http 为每次调用发送HTTP请求，websocket 为所有调用共用一条正向WebSocket长连接
+            ws_port: napcat正向WebSocket服务端口
+            ws_path: napcat正向WebSocket服务路径
+        """
+        if transport not in ("http", "websocket"):
+            logger.warning(f"未知的napcat.transport: {transport}，使用http")
+            transport = "http"
+        cls.transport = transport
+        cls.ws_port = int(ws_port)
+        cls.ws_path = ws_path or "/"
+
+    @classmethod
+    async def close_transports(cls):
+        """断开所有WebSocket长连接"""
+        connections = list(cls._websockets.values())
+        cls._websockets.clear()
+        for connection in connections:
+            await connection.close()
+
+    @classmethod
+    def transport_stats(cls) -> dict:
+        """当前通信方式和WebSocket重连次数"""
+        return {
+            "transport": cls.transport,
+            "ws_reconnects": {f"{address}:{port}": connection.reconnects
+                              for (address, port), connection in sorted(cls._websockets.items())},
+        }
+
+    @classmethod
+    def breaker_states(cls) -> Dict[str, str]:
+        """各接口熔断器的当前状态"""
+        return {f"{endpoint}@{address}:{port}": breaker.state
+                for (address, port, endpoint), breaker in sorted(cls._breakers.items())}
+
+    @staticmethod
+    async def _make_request(address: str, port: int, endpoint: str, payload: dict) -> Tuple[bool, Union[dict, str]]:
+        """发送请求到napcat，受命令时限约束
+
+        只读接口的相同请求在进行中时会合并为一次HTTP调用（single-flight），
+        所有等待者拿到同一个解析结果，调用方不应修改返回的数据。
+        """
+        timeout = NAPCAT_TIMEOUT
+        deadline = _napcat_deadline.get()
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                return False, "超出命令时限，已跳过请求"
+
+        if endpoint not in NapcatAPI.READ_ENDPOINTS:
+            return await NapcatAPI._call(address, port, endpoint, payload, timeout)
+
+        key = (address, int(port), endpoint, json.dumps(payload, sort_keys=True))
+        task = NapcatAPI._inflight.get(key)
+        if task is None:
+            # 共享的请求使用完整超时，每个等待者只用自己的剩余时限约束等待时间
+            task = asyncio.ensure_future(NapcatAPI._call(address, port, endpoint, payload, NAPCAT_TIMEOUT))
+            NapcatAPI._inflight[key] = task
+            task.add_done_callback(lambda done: NapcatAPI._inflight.pop(key, None) if NapcatAPI._inflight.get(key) is done else None)
+        else:
+            NapcatAPI.coalesced += 1
+        try:
+            # 共享的请求不随单个等待者的取消或超时而中断
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            return False, NAPCAT_TIMEOUT_ERROR
+
+    @staticmethod
+    async def _call(address: str, port: int, endpoint: str, payload: dict,
+                    timeout: float) -> Tuple[bool, Union[dict, str]]:
+        """经过熔断器发送一次请求并记录耗时"""
+        key = (address, int(port), endpoint)
+        breaker = NapcatAPI._breakers.get(key)
+        if breaker is None:
+            breaker = NapcatAPI._breakers[key] = CircuitBreaker()
+        if not breaker.allow():
+            return False, f"{endpoint} 接口已熔断，暂停请求"
+
+        start = time.perf_counter()
+        verdict: Optional[bool] = None
+        try:
+            success, result = await NapcatAPI._send_request(address, port, endpoint, payload, timeout)
+            metrics.record(f"napcat.{endpoint}", time.perf_counter() - start, success)
+            # 命令剩余时限不足导致的超时不代表接口故障，不计入熔断
+            if success or result != NAPCAT_TIMEOUT_ERROR or timeout >= NAPCAT_TIMEOUT:
+                verdict = success
+            return success, result
+        finally:
+            # 被取消或没有结论时也要释放半开状态的试探名额，否则接口会一直熔断
+            if verdict is None:
+                breaker.release()
+            else:
+                breaker.record(verdict)
+
     @staticmethod
-    def _make_request(url: str, payload: dict) -> Tuple[bool, Union[dict, str]]:
-        """发送HTTP POST请求到napcat
+    async def _send_request(address: str, port: int, endpoint: str, payload: dict,
+                            timeout: float = NAPCAT_TIMEOUT) -> Tuple[bool, Union[dict, str]]:
+        """发送请求到napcat，按 transport 使用HTTP POST或WebSocket长连接
 
         Args:
-            url: 请求URL
+            address: napcat服务器地址
+            port: napcat服务器端口
+            endpoint: 接口名，如 get_group_info
             payload: 请求数据
+            timeout: 超时时间（秒）
 
         Returns:
             (True, response_data) 成功时
             (False, error_message) 失败时
         """
         try:
+            if NapcatAPI.transport == "websocket":
+                return True, await NapcatAPI._get_websocket(address).request(endpoint, payload, timeout)
             data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
-            request = Request(
-                url,
-                data=data,
-                headers={'Content-Type': 'application/json'},
-                method='POST'
-            )
-            with urlopen(request, timeout=10) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return True, result
-        except HTTPError as e:
-            return False, f"HTTP错误: {e.code}"
-        except URLError as e:
-            return False, f"网络错误: {e.reason}"
+            pool = NapcatAPI._get_pool(address, port)
+            status, body = await pool.request(f"/{endpoint}", data, timeout,
+                                              idempotent=endpoint in NapcatAPI.READ_ENDPOINTS)
+            if status >= 400:
+                return False, f"HTTP错误: {status}"
+            result = json.loads(body.decode('utf-8'))
+            return True, result
+        except asyncio.TimeoutError:
+            return False, NAPCAT_TIMEOUT_ERROR
+        except (OSError, asyncio.IncompleteReadError) as e:
+            return False, f"网络错误: {e}"
         except json.JSONDecodeError as e:
             return False, f"JSON解析错误: {e}"
         except Exception as e:
             return False, f"请求错误: {str(e)}"
 
     @staticmethod
-    def get_group_member_list(address: str, port: int, group_id: str) -> Tuple[bool, Union[list, str]]:
+    async def get_group_member_list(address: str, port: int, group_id: str) -> Tuple[bool, Union[list, str]]:
         """获取群成员列表
 
         Args:
@@ -96,10 +776,9 @@ class NapcatAPI:
             (True, member_list) 成功时返回成员列表
             (False, error_msg) 失败时返回错误信息
         """
-        url = f"http://{address}:{port}/get_group_member_list"
         payload = {"group_id": group_id, "no_cache": False}
 
-        success, result = NapcatAPI._make_request(url, payload)
+        success, result = await NapcatAPI._make_request(address, port, "get_group_member_list", payload)
         if not success:
             return False, result
 
@@ -109,7 +788,7 @@ class NapcatAPI:
         return True, data
 
     @staticmethod
-    def get_group_info(address: str, port: int, group_id: str) -> Tuple[bool, Union[dict, str]]:
+    async def get_group_info(address: str, port: int, group_id: str) -> Tuple[bool, Union[dict, str]]:
         """获取群信息
 
         Args:
@@ -121,10 +800,9 @@ class NapcatAPI:
             (True, group_info) 成功时返回群信息字典
             (False, error_msg) 失败时返回错误信息
         """
-        url = f"http://{address}:{port}/get_group_info"
         payload = {"group_id": group_id, "no_cache": False}
 
-        success, result = NapcatAPI._make_request(url, payload)
+        success, result = await NapcatAPI._make_request(address, port, "get_group_info", payload)
         if not success:
             return False, result
 
@@ -134,7 +812,7 @@ class NapcatAPI:
         return True, data
 
     @staticmethod
-    def get_stranger_info(address: str, port: int, user_id: str) -> Tuple[bool, Union[dict, str]]:
+    async def get_stranger_info(address: str, port: int, user_id: str) -> Tuple[bool, Union[dict, str]]:
         """获取陌生人信息
 
         Args:
@@ -146,10 +824,9 @@ class NapcatAPI:
             (True, stranger_info) 成功时返回用户信息字典
             (False, error_msg) 失败时返回错误信息
         """
-        url = f"http://{address}:{port}/get_stranger_info"
         payload = {"user_id": user_id}
 
-        success, result = NapcatAPI._make_request(url, payload)
+        success, result = await NapcatAPI._make_request(address, port, "get_stranger_info", payload)
         if not success:
             return False, result
 
@@ -159,7 +836,7 @@ class NapcatAPI:
         return True, data
 
     @staticmethod
-    def get_group_member_info(address: str, port: int, group_id: str, user_id: str) -> Tuple[bool, Union[dict, str]]:
+    async def get_group_member_info(address: str, port: int, group_id: str, user_id: str) -> Tuple[bool, Union[dict, str]]:
         """获取群成员信息
 
         Args:
@@ -172,10 +849,9 @@ class NapcatAPI:
             (True, member_info) 成功时返回群成员信息字典
             (False, error_msg) 失败时返回错误信息
         """
-        url = f"http://{address}:{port}/get_group_member_info"
         payload = {"group_id": group_id, "user_id": user_id, "no_cache": False}
 
-        success, result = NapcatAPI._make_request(url, payload)
+        success, result = await NapcatAPI._make_request(address, port, "get_group_member_info", payload)
         if not success:
             return False, result
 
@@ -185,7 +861,7 @@ class NapcatAPI:
         return True, data
 
     @staticmethod
-    def send_group_message(address: str, port: int, group_id: str, message: list) -> Tuple[bool, Optional[str]]:
+    async def send_group_message(address: str, port: int, group_id: str, message: list) -> Tuple[bool, Optional[str]]:
         """发送群消息
 
         Args:
@@ -198,45 +874,1330 @@ class NapcatAPI:
             (True, None) 成功时
             (False, error_msg) 失败时
         """
-        url = f"http://{address}:{port}/send_group_msg"
         payload = {
             "group_id": group_id,
             "message": message,
             "storage_message": False
         }
 
-        success, result = NapcatAPI._make_request(url, payload)
+        success, result = await NapcatAPI._make_request(address, port, "send_group_msg", payload)
+        if not success:
+            return False, result
+        return True, None
+
+    @staticmethod
+    async def send_forward_message(address: str, port: int, nodes: list, group_id: Optional[str] = None,
+                                   user_id: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+        """发送合并转发消息，指定group_id时发到群聊，否则私聊发给user_id
+
+        Args:
+            address: napcat服务器地址
+            port: napcat服务器端口
+            nodes: 转发消息节点列表
+            group_id: 群号
+            user_id: 用户QQ号
+
+        Returns:
+            (True, None) 成功时
+            (False, error_msg) 失败时
+        """
+        if group_id is not None:
+            endpoint, payload = "send_group_forward_msg", {"group_id": group_id, "messages": nodes}
+        else:
+            endpoint, payload = "send_private_forward_msg", {"user_id": user_id, "messages": nodes}
+
+        success, result = await NapcatAPI._make_request(address, port, endpoint, payload)
         if not success:
             return False, result
+        if result.get("status") == "failed":
+            return False, result.get("message") or result.get("wording") or "发送失败"
         return True, None
 
 
+# 通用LRU缓存
+class TTLCache:
+    """带过期时间的LRU缓存，记录命中和未命中次数"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Optional[Any]:
+        """获取缓存值，不存在或已过期时返回None"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.monotonic() < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: Any, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class TodayResultCache:
+    """当天抽取结果的内存缓存：(群号, QQ号) -> (老婆QQ号, 老婆昵称)
+
+    只保存一天的结果，日期变化时整体清空。已抽取用户重复发送命令时直接用缓存回复，
+    不再查询数据库和昵称。管理员修改记录后需要调用 invalidate 或 clear；
+    generation 在每次失效时递增，读数据库之前取得的 generation 过期后不会再写入缓存，
+    避免与修改并发的读取把旧结果放回缓存。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._date = ""
+        self._entries: Dict[Tuple[str, str], Tuple[str, Optional[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _roll_date(self, date: str) -> bool:
+        """切换到新的一天时清空缓存，返回date是否为当前日期"""
+        if date > self._date:
+            self._date = date
+            self._entries.clear()
+        return date == self._date
+
+    def get(self, group_id: str, user_id: str, date: str) -> Optional[Tuple[str, Optional[str]]]:
+        """获取当天的抽取结果
+
+        Returns:
+            (老婆QQ号, 老婆昵称)，昵称未知时为None；没有缓存时返回None
+        """
+        entry = self._entries.get((group_id, user_id)) if self._roll_date(date) else None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def peek(self, group_id: str, user_id: str, date: str) -> Optional[str]:
+        """获取缓存的老婆QQ号，不计入命中统计"""
+        entry = self._entries.get((group_id, user_id)) if date == self._date else None
+        return entry[0] if entry is not None else None
+
+    def put(self, group_id: str, user_id: str, date: str, wife_id: str, nickname: Optional[str], generation: int):
+        """写入抽取结果，generation 为读取结果之前的 self.generation，期间有失效时忽略本次写入"""
+        if generation != self.generation or not self._roll_date(date):
+            return
+        if len(self._entries) >= self.max_size and (group_id, user_id) not in self._entries:
+            return
+        self._entries[(group_id, user_id)] = (wife_id, nickname)
+
+    def invalidate(self, group_id: str, user_ids: List[str]):
+        """删除某个群中指定用户的结果"""
+        self.generation += 1
+        for user_id in user_ids:
+            self._entries.pop((group_id, user_id), None)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+
+# 群成员索引
+class GroupMemberIndex:
+    """群成员列表的紧凑索引，每次拉取成员列表时构建一次
+
+    QQ号按升序存放在 array('q') 中，配合 QQ号→下标 的字典，
+    排除自己的抽取和查询群名片都是O(1)，抽取时不再复制和遍历成员列表。
+    """
+
+    __slots__ = ("ids", "positions", "cards")
+
+    def __init__(self, members: list):
+        entries = {}
+        for member in members:
+            user_id = member.get("user_id")
+            if user_id is not None:
+                entries[int(user_id)] = member.get("card") or member.get("nickname") or ""
+        self.ids = array("q", sorted(entries))
+        self.positions: Dict[int, int] = {qq: i for i, qq in enumerate(self.ids)}
+        self.cards: List[str] = [entries[qq] for qq in self.ids]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, qq: Union[int, str]) -> bool:
+        return int(qq) in self.positions
+
+    def card(self, qq: Union[int, str]) -> Optional[str]:
+        """群名片（没有时为昵称），不在群内或为空时返回None"""
+        position = self.positions.get(int(qq))
+        if position is None:
+            return None
+        return self.cards[position] or None
+
+    def candidate_count(self, exclude: Union[int, str]) -> int:
+        """排除exclude后可选的成员数"""
+        return len(self.ids) - (int(exclude) in self.positions)
+
+    def candidate(self, index: int, exclude: Union[int, str]) -> int:
+        """排除exclude后的第index个成员（0 <= index < candidate_count(exclude)）"""
+        own = self.positions.get(int(exclude))
+        if own is not None and index >= own:
+            index += 1
+        return self.ids[index]
+
+    def sample(self, exclude: Union[int, str]) -> Optional[int]:
+        """随机选出一名除exclude以外的成员，没有其他成员时返回None"""
+        count = self.candidate_count(exclude)
+        if count <= 0:
+            return None
+        return self.candidate(random.randrange(count), exclude)
+
+
+# 群成员列表缓存
+class MemberListCache:
+    """按群号缓存群成员列表
+
+    - 缓存时间在ttl以内直接返回
+    - 超过ttl但在stale_ttl以内时先返回旧列表，同时在后台刷新（stale-while-revalidate）
+    - 超过stale_ttl或未缓存时同步拉取
+    - 最多缓存max_groups个群，超出时按LRU淘汰
+    - 传入nicknames时，每次拉取到的成员昵称会顺带写入昵称缓存
+    """
+
+    def __init__(self, ttl: float = 600, stale_ttl: float = 3600, max_groups: int = 64,
+                 nicknames: Optional[TTLCache] = None):
+        self.ttl = ttl
+        self.nicknames = nicknames
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_groups = max_groups
+        self.hits = 0
+        self.misses = 0
+        # 群号 -> (拉取时间, 成员列表, 成员索引)
+        self._entries: "OrderedDict[str, Tuple[float, list, GroupMemberIndex]]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    async def get(self, address: str, port: int, group_id: str) -> Tuple[bool, Union[list, str]]:
+        """获取群成员列表，返回值与 NapcatAPI.get_group_member_list 相同
+
+        超过stale_ttl的旧列表在napcat不可用时仍会作为降级结果返回。
+        """
+        success, entry = await self._get_entry(address, port, group_id)
+        return (True, entry[1]) if success else (False, entry)
+
+    async def get_index(self, address: str, port: int, group_id: str) -> Tuple[bool, Union[GroupMemberIndex, str]]:
+        """获取群成员索引，缓存规则与 get 相同"""
+        success, entry = await self._get_entry(address, port, group_id)
+        return (True, entry[2]) if success else (False, entry)
+
+    async def _get_entry(self, address: str, port: int, group_id: str) -> Tuple[bool, Union[tuple, str]]:
+        entry = self._entries.get(group_id)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.stale_ttl:
+                self._entries.move_to_end(group_id)
+                if age >= self.ttl:
+                    self._schedule_refresh(address, port, group_id)
+                self.hits += 1
+                return True, entry
+        self.misses += 1
+        success, result = await self.refresh(address, port, group_id)
+        if success:
+            return True, self._entries.get(group_id) or (time.monotonic(), result, GroupMemberIndex(result))
+        if entry is not None:
+            logger.warning(f"拉取群 {group_id} 成员列表失败，使用过期的缓存: {result}")
+            return True, entry
+        return False, result
+
+    async def refresh(self, address: str, port: int, group_id: str) -> Tuple[bool, Union[list, str]]:
+        """强制从napcat重新拉取群成员列表并写入缓存"""
+        success, members = await NapcatAPI.get_group_member_list(address, port, group_id)
+        if success:
+            self._store(group_id, members)
+        return success, members
+
+    def invalidate(self, group_id: str):
+        """丢弃群的缓存，下次获取时重新拉取"""
+        self._entries.pop(group_id, None)
+
+    def group_ids(self) -> List[str]:
+        """当前缓存中的群号"""
+        return list(self._entries)
+
+    def _store(self, group_id: str, members: list):
+        self._entries[group_id] = (time.monotonic(), members, GroupMemberIndex(members))
+        self._entries.move_to_end(group_id)
+        while len(self._entries) > self.max_groups:
+            self._entries.popitem(last=False)
+
+        if self.nicknames is not None:
+            for member in members:
+                nickname = member.get("nickname") or member.get("card")
+                if nickname:
+                    self.nicknames.set(str(member.get("user_id")), nickname)
+
+    def _schedule_refresh(self, address: str, port: int, group_id: str):
+        if group_id in self._refreshing:
+            return
+        task = asyncio.create_task(self._background_refresh(address, port, group_id))
+        self._refreshing[group_id] = task
+
+    async def _background_refresh(self, address: str, port: int, group_id: str):
+        _detach_deadline()
+        try:
+            success, result = await self.refresh(address, port, group_id)
+            if not success:
+                logger.warning(f"后台刷新群 {group_id} 成员列表失败，继续使用旧数据: {result}")
+        finally:
+            self._refreshing.pop(group_id, None)
+
+
+# 头像本地缓存
+class AvatarCache:
+    """把QQ头像缓存在插件目录下，回复时直接发送本地文件或base64，不再让napcat每次下载
+
+    - 文件名为 {QQ号}_{尺寸}.jpg，超过ttl的头像会重新下载，下载失败时继续使用旧文件
+    - 缓存总大小超过max_bytes时按最近使用时间淘汰
+    - fetcher为 async (url) -> bytes，默认使用内置的HTTP连接池，可替换为其它实现
+    - 连续下载失败时暂停下载一段时间，期间直接发送远程地址
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, ttl: float, image_size: int = 640,
+                 url_template: str = AVATAR_URL_TEMPLATE, send_mode: str = "base64",
+                 fetcher: Optional[Callable[[str], Awaitable[bytes]]] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.image_size = image_size
+        self.url_template = url_template
+        self.send_mode = send_mode
+        self.fetcher = fetcher or self._http_fetch
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        # QQ号 -> (文件大小, 下载时间)，按最近使用顺序排列
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._fetching: Dict[str, asyncio.Task] = {}
+        self._pools: Dict[Tuple[str, int, bool], _HttpConnectionPool] = {}
+        # 头像服务器不可用时暂停下载，直接发送远程地址
+        self._breaker = CircuitBreaker()
+        self._load()
+
+    def _load(self):
+        # 启动时按文件的访问时间恢复LRU顺序
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.directory.glob(f"*_{self.image_size}.jpg"):
+            stat = path.stat()
+            files.append((stat.st_atime, path.name.split("_")[0], stat.st_size, stat.st_mtime))
+        for _, qq, size, mtime in sorted(files):
+            self._entries[qq] = (size, mtime)
+            self.total_bytes += size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def url(self, qq: str) -> str:
+        """头像的远程地址"""
+        return self.url_template.format(qq=qq, size=self.image_size)
+
+    def _path(self, qq: str) -> Path:
+        return self.directory / f"{qq}_{self.image_size}.jpg"
+
+    async def get(self, qq: str) -> str:
+        """返回可直接放进image消息段file字段的值，缓存和下载都失败时返回远程地址"""
+        try:
+            return await self._get(qq)
+        except OSError as e:
+            # 缓存文件被删除或被并发下载淘汰，丢弃这条记录，下次重新下载
+            logger.warning(f"读取头像缓存失败 {qq}: {e}")
+            self._forget(qq)
+            return self.url(qq)
+
+    def _forget(self, qq: str):
+        entry = self._entries.pop(qq, None)
+        if entry is not None:
+            self.total_bytes -= entry[0]
+
+    async def _get(self, qq: str) -> str:
+        entry = self._entries.get(qq)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            self._entries.move_to_end(qq)
+            self.hits += 1
+            return await self._encode(qq)
+
+        self.misses += 1
+        task = self._fetching.get(qq)
+        if task is None:
+            if not self._breaker.allow():
+                return await self._encode(qq) if qq in self._entries else self.url(qq)
+            task = asyncio.ensure_future(self._download(qq))
+            self._fetching[qq] = task
+            task.add_done_callback(lambda _: self._fetching.pop(qq, None))
+        # 下载在后台按自己的超时进行，命令只在自己的剩余时限内等待，超时后先发送远程地址
+        deadline = _napcat_deadline.get()
+        try:
+            if deadline is None:
+                downloaded = await asyncio.shield(task)
+            else:
+                downloaded = await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            downloaded = False
+        if downloaded or qq in self._entries:
+            # 下载失败但有过期的旧文件时继续使用旧文件
+            return await self._encode(qq)
+        return self.url(qq)
+
+    async def _download(self, qq: str) -> bool:
+        # 下载由多个命令共享，不受发起它的命令的时限约束，超时只按 AVATAR_FETCH_TIMEOUT 计算
+        _detach_deadline()
+        try:
+            data = await self.fetcher(self.url(qq))
+        except Exception as e:
+            logger.warning(f"下载头像失败 {qq}: {e}")
+            data = b""
+        self._breaker.record(bool(data))
+        if not data:
+            return False
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._write, qq, data)
+        except OSError as e:
+            logger.warning(f"写入头像缓存失败 {qq}: {e}")
+            return False
+        self._forget(qq)
+        self._entries[qq] = (len(data), time.time())
+        self.total_bytes += len(data)
+
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            victim, (size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            evicted.append(victim)
+        if evicted:
+            try:
+                await loop.run_in_executor(None, self._remove, evicted)
+            except OSError as e:
+                logger.warning(f"删除头像缓存失败: {e}")
+        return True
+
+    def _write(self, qq: str, data: bytes):
+        # 先写临时文件再替换，避免发送时读到写了一半的文件
+        path = self._path(qq)
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_bytes(data)
+        temp_path.replace(path)
+
+    def _remove(self, qqs: List[str]):
+        for qq in qqs:
+            self._path(qq).unlink(missing_ok=True)
+
+    async def _encode(self, qq: str) -> str:
+        path = self._path(qq)
+        if self.send_mode == "file":
+            # 文件不存在时抛出 FileNotFoundError，由 get 降级为远程地址
+            path.stat()
+            return path.absolute().as_uri()
+        data = await asyncio.get_running_loop().run_in_executor(None, path.read_bytes)
+        return "base64://" + base64.b64encode(data).decode("ascii")
+
+    async def _http_fetch(self, url: str) -> bytes:
+        """默认的下载实现，复用keep-alive连接，支持http和https"""
+        parsed = urllib.parse.urlsplit(url)
+        use_ssl = parsed.scheme == "https"
+        port = parsed.port or (443 if use_ssl else 80)
+        key = (parsed.hostname, port, use_ssl)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = _HttpConnectionPool(parsed.hostname, port, use_ssl=use_ssl)
+
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        start = time.perf_counter()
+        status, body = await pool.request(path, None, AVATAR_FETCH_TIMEOUT)
+        metrics.record("avatar.fetch", time.perf_counter() - start, status == 200)
+        if status != 200:
+            raise OSError(f"HTTP错误: {status}")
+        return body
+
+
+# 后台任务队列
+class BackgroundTaskQueue:
+    """执行审计日志、昵称补全等非关键任务的后台队列
+
+    用户可见的回复不等待这些任务。队列长度有上限，满了以后丢弃最早的任务；
+    关闭时让工作协程做完手上的任务，并在限定时间内执行完剩余任务。
+    """
+
+    def __init__(self, max_size: int = 256, workers: int = 2):
+        self.max_size = max_size
+        self.workers = workers
+        self.dropped = 0
+        self._queue: Deque[Callable[[], Awaitable[Any]]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def submit(self, job: Callable[[], Awaitable[Any]]):
+        """提交一个任务，job 为返回协程的无参函数，需要在事件循环中调用"""
+        if len(self._queue) >= self.max_size:
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(job)
+        if not self._tasks:
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._wakeup.set()
+
+    async def _worker(self):
+        _detach_deadline()
+        while not self._closing:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run(self._queue.popleft())
+
+    @staticmethod
+    async def _run(job: Callable[[], Awaitable[Any]]):
+        try:
+            await job()
+        except Exception as e:
+            logger.warning(f"后台任务执行失败: {e}")
+
+    async def close(self, timeout: float = 5.0):
+        """在timeout秒内做完正在执行和排队的任务，之后停止工作协程"""
+        tasks, self._tasks = self._tasks, []
+        # 工作协程做完手上的任务后退出，剩余任务由下面统一执行
+        self._closing = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        async def drain():
+            await asyncio.gather(*tasks, return_exceptions=True)
+            while self._queue:
+                await self._run(self._queue.popleft())
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"关闭时仍有 {len(self._queue)} 个后台任务未执行，已丢弃")
+            self._queue.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# 按群发送队列
+class GroupSendQueue:
+    """按群排队发送回复消息，每个群一个令牌桶限速
+
+    同一个群短时间内大量发送会触发QQ风控，导致发送变慢甚至失败。每个群的消息按顺序排队，
+    令牌桶允许 burst 条的突发，之后按每秒 rate 条发送；队列满时直接返回失败。
+    某个群积压达到 coalesce_threshold 条时，把队首连续的可合并消息（抽取结果）
+    最多 coalesce_max 条合并成一条发送，这些消息的发送者拿到同一个发送结果。
+    """
+
+    def __init__(self, send: Callable[[str, list], Awaitable[Tuple[bool, Optional[str]]]], rate: float = 1.0,
+                 burst: int = 5, max_size: int = 100, coalesce_threshold: int = 3, coalesce_max: int = 10):
+        """
+        Args:
+            send: 实际发送消息的函数，参数为 (群号, 消息段列表)
+            rate: 每个群每秒发送的消息数
+            burst: 每个群允许连续发送的消息数
+            max_size: 每个群最多排队的消息数
+            coalesce_threshold: 积压多少条时开始合并
+            coalesce_max: 最多合并多少条
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_size = max_size
+        self.coalesce_threshold = max(2, coalesce_threshold)
+        self.coalesce_max = max(1, coalesce_max)
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.peak_depth = 0
+        self._send = send
+        self._pending: Dict[str, Deque[Tuple[list, bool, float, asyncio.Future]]] = {}
+        self._tokens: Dict[str, Tuple[float, float]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+
+    def depths(self) -> Dict[str, int]:
+        """各群当前排队的消息数"""
+        return {group_id: len(queue) for group_id, queue in self._pending.items() if queue}
+
+    async def send(self, group_id: str, message: list, coalesce: bool = False) -> Tuple[bool, Optional[str]]:
+        """把消息加入群的发送队列并等待发送完成
+
+        Args:
+            group_id: 群号
+            message: 消息段列表
+            coalesce: 积压时是否允许与其它可合并的消息合并发送
+
+        Returns:
+            (True, None) 成功时
+            (False, error_message) 失败时
+        """
+        queue = self._pending.setdefault(group_id, deque())
+        if len(queue) >= self.max_size:
+            self.dropped += 1
+            return False, "发送队列已满"
+        future = asyncio.get_running_loop().create_future()
+        queue.append((message, coalesce, time.perf_counter(), future))
+        self.peak_depth = max(self.peak_depth, len(queue))
+        if group_id not in self._workers:
+            self._workers[group_id] = asyncio.create_task(self._worker(group_id))
+        return await future
+
+    async def _take_token(self, group_id: str):
+        now = time.monotonic()
+        tokens, updated = self._tokens.get(group_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            await asyncio.sleep((1 - tokens) / self.rate)
+            now, tokens = time.monotonic(), 1
+        self._tokens[group_id] = (tokens - 1, now)
+
+    async def _worker(self, group_id: str):
+        _detach_deadline()
+        queue = self._pending[group_id]
+        batch: List[Tuple[list, bool, float, asyncio.Future]] = []
+        try:
+            while queue:
+                if self.rate > 0:
+                    await self._take_token(group_id)
+                # 等待令牌期间可能又有消息入队，取到令牌后再决定是否合并
+                batch = [queue.popleft()]
+                if batch[0][1] and len(queue) + 1 >= self.coalesce_threshold:
+                    while queue and queue[0][1] and len(batch) < self.coalesce_max:
+                        batch.append(queue.popleft())
+
+                message = list(batch[0][0])
+                for item in batch[1:]:
+                    message.append({"type": "text", "data": {"text": "\n"}})
+                    message.extend(item[0])
+                self.coalesced += len(batch) - 1
+                started = time.perf_counter()
+                for _, _, enqueued_at, _ in batch:
+                    metrics.record("send.queue_wait", started - enqueued_at)
+
+                try:
+                    result = await self._send(group_id, message)
+                except Exception as e:
+                    result = (False, f"发送错误: {e}")
+                self.sent += 1
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_result(result)
+                batch = []
+        finally:
+            # 发送中途被取消时，已出队的这批消息的发送者也要拿到结果
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_result((False, "插件已停止，消息未发送"))
+            del self._workers[group_id]
+            if not queue:
+                del self._pending[group_id]
+
+    async def close(self, timeout: float = 5.0):
+        """在timeout秒内发送完剩余消息，之后停止发送，未发送的消息返回失败"""
+        workers = list(self._workers.values())
+        if workers:
+            await asyncio.wait(workers, timeout=timeout)
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._pending.values():
+            for _, _, _, future in queue:
+                if not future.done():
+                    future.set_result((False, "插件已停止，消息未发送"))
+        if any(self._pending.values()):
+            logger.warning(f"关闭时仍有 {len(self)} 条消息未发送，已丢弃")
+        self._pending.clear()
+
+
+def deterministic_pick(secret: bytes, group_id: str, user_id: str, date: str, members: GroupMemberIndex) -> Optional[int]:
+    """根据 (群号, 用户QQ号, 日期) 的带密钥哈希从群成员中确定地选出一人
+
+    使用最高随机权重（rendezvous）哈希：每个成员的得分为
+    HMAC(secret, 群号:用户QQ号:日期:成员QQ号)，选得分最高的成员。
+    当天有人入群或退群时，只有新成员得分最高或原结果退群的用户结果会变化。
+
+    Args:
+        secret: 哈希密钥
+        group_id: 群号
+        user_id: 用户QQ号
+        date: 日期 (YYYY-MM-DD格式)
+        members: 群成员索引
+
+    Returns:
+        选中的QQ号，除自己外没有其他成员时返回None
+    """
+    base = hmac.new(secret, f"{group_id}:{user_id}:{date}:".encode("utf-8"), hashlib.sha256)
+    own = int(user_id)
+    best, best_score = None, b""
+    for qq in members.ids:
+        if qq == own:
+            continue
+        score = base.copy()
+        score.update(str(qq).encode("ascii"))
+        digest = score.digest()
+        if digest > best_score:
+            best, best_score = qq, digest
+    return best
+
+
+# 插件级共享状态
+class JrlpContext:
+    """插件级共享状态
+
+    命令组件每条消息都会重新实例化，需要跨消息复用的数据库、缓存等对象统一放在这里，
+    插件加载时按插件配置创建。
+    """
+    _instance: Optional["JrlpContext"] = None
+
+    def __init__(self, get_config: Callable[..., Any]):
+        database = self._open_storage(get_config)
+        self.roll_mode = get_config("roll.mode", "random")
+        # 确定性模式的哈希密钥，未配置时生成一个并保存在数据库中，保证重启后结果不变
+        self.roll_secret = (
+            get_config("roll.secret", "") or database.ensure_meta("roll_secret", secrets.token_hex(16))
+        ).encode("utf-8")
+        self._rolled_date = ""
+        # 确定性模式下当天已收到结果的用户，按群号分组并保持抽取顺序
+        self._rolled: Dict[str, Dict[str, None]] = {}
+
+        self.storage = database
+        self.db = AsyncJrlpDatabase(database, readers=get_config("database.reader_threads", 2))
+        if get_config("database.write_behind", False):
+            self.db = WriteBehindDatabase(
+                self.db,
+                flush_interval=get_config("database.flush_interval", 1.0),
+                flush_batch_size=get_config("database.flush_batch_size", 200),
+            )
+        self.nicknames = TTLCache(
+            max_size=get_config("cache.nickname_max_size", 8192),
+            ttl=get_config("cache.nickname_ttl", 3600),
+        )
+        self.today_results = TodayResultCache(max_size=get_config("cache.today_max_size", 100000))
+        self.member_lists = MemberListCache(
+            ttl=get_config("cache.member_list_ttl", 600),
+            stale_ttl=get_config("cache.member_list_stale_ttl", 3600),
+            max_groups=get_config("cache.member_list_max_groups", 64),
+            nicknames=self.nicknames,
+        )
+        self.group_names = TTLCache(
+            max_size=get_config("cache.member_list_max_groups", 64),
+            ttl=get_config("cache.member_list_ttl", 600),
+        )
+        self.avatars: Optional[AvatarCache] = None
+        if get_config("avatar.enabled", True):
+            self.avatars = AvatarCache(
+                Path(__file__).parent.absolute() / "avatars",
+                max_bytes=get_config("avatar.max_size_mb", 64) * 1024 * 1024,
+                ttl=get_config("avatar.ttl_hours", 24) * 3600,
+                image_size=get_config("avatar.image_size", 640),
+                url_template=get_config("avatar.url_template", AVATAR_URL_TEMPLATE),
+                send_mode=get_config("avatar.send_mode", "base64"),
+            )
+        self.side_tasks = BackgroundTaskQueue(max_size=get_config("background.queue_size", 256))
+        self.retention_enabled = get_config("retention.enabled", True)
+        self.retention_days = max(1, get_config("retention.hot_days", 7))
+        self.retention_interval = get_config("retention.interval_hours", 24) * 3600
+        self.napcat_address = get_config("napcat.address", "napcat")
+        self.napcat_port = get_config("napcat.port", 3000)
+        NapcatAPI.configure(
+            transport=get_config("napcat.transport", "http"),
+            ws_port=get_config("napcat.ws_port", 3001),
+            ws_path=get_config("napcat.ws_path", "/"),
+        )
+        self.send_queue: Optional[GroupSendQueue] = None
+        if get_config("send.enabled", True):
+            self.send_queue = GroupSendQueue(
+                functools.partial(NapcatAPI.send_group_message, self.napcat_address, self.napcat_port),
+                rate=get_config("send.rate", 1.0),
+                burst=get_config("send.burst", 5),
+                max_size=get_config("send.queue_size", 100),
+                coalesce_threshold=get_config("send.coalesce_threshold", 3),
+                coalesce_max=get_config("send.coalesce_max", 10),
+            )
+        self.prewarm_enabled = get_config("prewarm.enabled", True)
+        self.prewarm_lead = get_config("prewarm.lead_seconds", 120)
+        self.prewarm_days = max(1, get_config("prewarm.active_days", 3))
+        self.prewarm_concurrency = max(1, get_config("prewarm.concurrency", 4))
+        self.stats_dump_interval = get_config("stats.dump_interval", 0)
+        self.stats_path = Path(__file__).parent.absolute() / "jrlp_stats.json"
+        self._tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def get(cls, get_config: Callable[..., Any]) -> "JrlpContext":
+        """获取共享状态，不存在时按传入的配置读取函数创建"""
+        if cls._instance is None:
+            cls._instance = cls(get_config)
+        return cls._instance
+
+    @staticmethod
+    def _open_storage(get_config: Callable[..., Any]) -> "JrlpStorage":
+        """按 database.backend 创建存储"""
+        plugin_dir = Path(__file__).parent.absolute()
+        backend = get_config("database.backend", "sqlite")
+        if backend == "memory":
+            return MemoryJrlpStorage()
+        if backend == "sharded":
+            shards = max(1, get_config("database.shards", 8))
+            return ShardedJrlpDatabase(plugin_dir / f"jrlp_shards_{shards}", shards)
+        if backend != "sqlite":
+            logger.warning(f"未知的存储方式 {backend}，使用 sqlite")
+        return JrlpDatabase(plugin_dir / "jrlp.db")
+
+    async def reshard(self) -> Tuple[int, List[str]]:
+        """把单文件数据库和其它分片数的旧分片中的数据复制到当前分片
+
+        Returns:
+            (复制的记录数, 数据来源的文件名列表)
+        """
+        if not isinstance(self.storage, ShardedJrlpDatabase):
+            raise ValueError("当前存储方式不是 sharded，无需迁移")
+        plugin_dir = Path(__file__).parent.absolute()
+        sources = [plugin_dir / "jrlp.db"] if (plugin_dir / "jrlp.db").exists() else []
+        for directory in sorted(plugin_dir.glob("jrlp_shards_*")):
+            if directory.resolve() != self.storage.directory.resolve():
+                sources.extend(sorted(directory.glob("jrlp_*.db")))
+        copied = await self.db.import_files(sources)
+        self.today_results.clear()
+        return copied, [str(path.relative_to(plugin_dir)) for path in sources]
+
+    def ensure_started(self):
+        """启动后台任务，重复调用不会重复启动，需要在事件循环中调用"""
+        if self._tasks:
+            return
+        if self.retention_enabled:
+            self._tasks.append(asyncio.create_task(self._retention_loop()))
+        if self.stats_dump_interval > 0:
+            self._tasks.append(asyncio.create_task(self._stats_dump_loop()))
+        if self.prewarm_enabled:
+            self._tasks.append(asyncio.create_task(self._prewarm_loop()))
+
+    async def _prewarm_loop(self):
+        # 启动时预热一次，之后每天在零点前 prewarm_lead 秒预热
+        _detach_deadline()
+        await self.prewarm()
+        while True:
+            now = datetime.datetime.now()
+            midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+            next_run = midnight - datetime.timedelta(seconds=self.prewarm_lead)
+            if next_run <= now:
+                next_run += datetime.timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
+            await self.prewarm()
+
+    async def prewarm(self):
+        """预先拉取近期活跃群的成员列表和群信息"""
+        since = (datetime.date.today() - datetime.timedelta(days=self.prewarm_days - 1)).strftime("%Y-%m-%d")
+        try:
+            groups = set(await self.db.get_active_groups(since))
+        except Exception as e:
+            logger.warning(f"查询活跃群失败，跳过预热: {e}")
+            return
+        groups.update(self.member_lists.group_ids())
+        if not groups:
+            return
+
+        semaphore = asyncio.Semaphore(self.prewarm_concurrency)
+
+        async def warm(group_id: str) -> bool:
+            async with semaphore:
+                success, _ = await self.member_lists.refresh(self.napcat_address, self.napcat_port, group_id)
+                await self.get_group_name(self.napcat_address, self.napcat_port, group_id, refresh=True)
+                return success
+
+        start = time.monotonic()
+        results = await asyncio.gather(*(warm(group_id) for group_id in groups))
+        logger.info(f"已预热 {sum(results)}/{len(groups)} 个群的成员列表，耗时 {time.monotonic() - start:.1f}s")
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        """汇总各阶段耗时和缓存命中情况"""
+        return {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "stages": metrics.snapshot(),
+            "caches": {
+                "nickname": {"size": len(self.nicknames), "hits": self.nicknames.hits, "misses": self.nicknames.misses},
+                "today": {
+                    "size": len(self.today_results), "hits": self.today_results.hits, "misses": self.today_results.misses
+                },
+                "member_list": {"hits": self.member_lists.hits, "misses": self.member_lists.misses},
+                "avatar": {
+                    "size": len(self.avatars) if self.avatars else 0,
+                    "bytes": self.avatars.total_bytes if self.avatars else 0,
+                    "hits": self.avatars.hits if self.avatars else 0,
+                    "misses": self.avatars.misses if self.avatars else 0,
+                },
+            },
+            "background": {"queued": len(self.side_tasks), "dropped": self.side_tasks.dropped},
+            "send_queue": {
+                "depth": len(self.send_queue) if self.send_queue else 0,
+                "groups": self.send_queue.depths() if self.send_queue else {},
+                "peak_depth": self.send_queue.peak_depth if self.send_queue else 0,
+                "sent": self.send_queue.sent if self.send_queue else 0,
+                "coalesced": self.send_queue.coalesced if self.send_queue else 0,
+                "dropped": self.send_queue.dropped if self.send_queue else 0,
+            },
+            "breakers": NapcatAPI.breaker_states(),
+            "napcat": {"coalesced": NapcatAPI.coalesced, **NapcatAPI.transport_stats()},
+        }
+
+    async def _stats_dump_loop(self):
+        # 定期把统计数据写入数据库旁的JSON文件
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.stats_dump_interval)
+            try:
+                await loop.run_in_executor(None, self._dump_stats, self.stats_snapshot())
+            except Exception as e:
+                logger.warning(f"写入统计文件失败: {e}")
+
+    def _dump_stats(self, snapshot: Dict[str, Any]):
+        temp_path = self.stats_path.with_suffix(".json.tmp")
+        temp_path.write_text(json.dumps(snapshot, ensure_ascii=False, indent=2), encoding="utf-8")
+        temp_path.replace(self.stats_path)
+
+    async def _retention_loop(self):
+        # 定期把超出保留天数的记录移入归档表
+        while True:
+            cutoff = (datetime.date.today() - datetime.timedelta(days=self.retention_days - 1)).strftime("%Y-%m-%d")
+            try:
+                archived = await self.db.archive_before(cutoff)
+                if archived:
+                    logger.info(f"已归档 {archived} 条 {cutoff} 之前的抽取记录")
+            except Exception as e:
+                logger.error(f"归档历史记录失败: {e}", exc_info=True)
+            await asyncio.sleep(self.retention_interval)
+
+    @classmethod
+    async def shutdown(cls):
+        """插件停止时停止后台任务，写入未提交的数据并释放资源"""
+        context, cls._instance = cls._instance, None
+        if context is None:
+            return
+        for task in context._tasks:
+            task.cancel()
+        await asyncio.gather(*context._tasks, return_exceptions=True)
+        if context.send_queue is not None:
+            await context.send_queue.close()
+        await context.side_tasks.close()
+        await context.db.close()
+        await NapcatAPI.close_transports()
+
+    async def get_group_name(self, address: str, port: int, group_id: str, refresh: bool = False) -> str:
+        """获取群名称，优先使用缓存，获取失败时返回 "未知"
+
+        Args:
+            refresh: 为True时忽略缓存重新获取
+        """
+        group_name = None if refresh else self.group_names.get(group_id)
+        if group_name is not None:
+            return group_name
+
+        success, group_info = await NapcatAPI.get_group_info(address, port, group_id)
+        if not success:
+            return "未知"
+        group_name = group_info.get("group_name", "未知")
+        self.group_names.set(group_id, group_name)
+        return group_name
+
+    def deterministic_wife(self, group_id: str, user_id: str, date: str, members: GroupMemberIndex) -> Optional[str]:
+        """确定性模式下计算用户当天的老婆，除自己外没有其他成员时返回None"""
+        wife_qq = deterministic_pick(self.roll_secret, group_id, user_id, date, members)
+        return str(wife_qq) if wife_qq is not None else None
+
+    def mark_rolled(self, group_id: str, user_id: str, date: str) -> bool:
+        """确定性模式下记录用户当天已收到结果
+
+        Returns:
+            是否为当天第一次
+        """
+        if date != self._rolled_date:
+            self._rolled_date = date
+            self._rolled.clear()
+        rolled = self._rolled.setdefault(group_id, {})
+        if user_id in rolled:
+            return False
+        rolled[user_id] = None
+        return True
+
+    async def get_group_today_results(self, address: str, port: int, group_id: str,
+                                      date: str) -> List[Tuple[str, str]]:
+        """群当天的全部结果 [(QQ号, 老婆QQ号), ...]
+
+        确定性模式下数据库只有管理员指定的记录，另外按哈希计算本次启动以来当天已抽取成员的结果
+        """
+        records = list(await self.db.get_group_all_wives(group_id, date))
+        if self.roll_mode != "deterministic" or date != self._rolled_date:
+            return records
+        overridden = {qq for qq, _ in records}
+        rolled = [qq for qq in self._rolled.get(group_id, ()) if qq not in overridden]
+        # 抽取时已算出的结果在当天结果缓存中，只为缓存中没有的成员重新计算
+        missing = [qq for qq in rolled if self.today_results.peek(group_id, qq, date) is None]
+        members = None
+        if missing:
+            success, members = await self.member_lists.get_index(address, port, group_id)
+            if not success:
+                members = None
+        for qq in rolled:
+            wife_qq = self.today_results.peek(group_id, qq, date)
+            if wife_qq is None and members is not None:
+                wife_qq = self.deterministic_wife(group_id, qq, date, members)
+            if wife_qq is not None:
+                records.append((qq, wife_qq))
+        return records
+
+    async def get_nickname(self, address: str, port: int, qq: str) -> Optional[str]:
+        """获取QQ昵称，优先使用缓存
+
+        Returns:
+            昵称，获取失败时返回None
+        """
+        nickname = self.nicknames.get(qq)
+        if nickname is not None:
+            return nickname
+
+        success, info = await NapcatAPI.get_stranger_info(address, port, qq)
+        if not success:
+            return None
+        nickname = info.get("nickname", "未知")
+        self.nicknames.set(qq, nickname)
+        return nickname
+
+    async def get_nicknames(self, address: str, port: int, group_id: str, qqs: List[str]) -> Dict[str, str]:
+        """批量获取昵称
+
+        先查缓存，未命中时拉取一次群成员列表（同时写入昵称缓存），
+        只有已退群等不在列表中的QQ号才逐个并发查询，全部失败时以QQ号代替。
+        """
+        names: Dict[str, str] = {}
+        missing = []
+        for qq in dict.fromkeys(qqs):
+            nickname = self.nicknames.get(qq)
+            if nickname is not None:
+                names[qq] = nickname
+            else:
+                missing.append(qq)
+
+        if missing:
+            success, member_list = await self.member_lists.get(address, port, group_id)
+            if success:
+                members = {str(m.get("user_id")): m for m in member_list}
+                still_missing = []
+                for qq in missing:
+                    member = members.get(qq)
+                    nickname = member and (member.get("nickname") or member.get("card"))
+                    if nickname:
+                        names[qq] = nickname
+                    else:
+                        still_missing.append(qq)
+                missing = still_missing
+
+        if missing:
+            results = await asyncio.gather(*(self.get_nickname(address, port, qq) for qq in missing))
+            for qq, nickname in zip(missing, results):
+                names[qq] = nickname or qq
+        return names
+
+
+# RETURNING 子句需要 SQLite 3.35 及以上版本
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+# 存储接口
+class JrlpStorage(ABC):
+    """今日老婆的存储接口，命令通过 AsyncJrlpDatabase 使用，具体实现由 database.backend 选择
+
+    - sqlite：单个 jrlp.db 文件（JrlpDatabase）
+    - sharded：按群号哈希分散到多个SQLite文件（ShardedJrlpDatabase）
+    - memory：纯内存，不落盘，用于测试和基准测试（MemoryJrlpStorage）
+
+    所有方法都是同步的，会在 AsyncJrlpDatabase 的线程中执行，实现需要保证线程安全。
+    各方法的参数和返回值与 JrlpDatabase 中的同名方法相同。
+    """
+
+    # 可以并行写入的通道数，同一通道内的写操作由同一个线程串行执行
+    write_lanes = 1
+
+    def write_lane(self, group: str) -> int:
+        """群的写操作所在的通道"""
+        return 0
+
+    def lane_storage(self, lane: int) -> "JrlpStorage":
+        """只包含某个写通道数据的存储，重建统计、归档等全库操作按通道分别在各自的写线程上执行"""
+        return self
+
+    @abstractmethod
+    def close(self):
+        """释放资源"""
+
+    @abstractmethod
+    def ensure_meta(self, key: str, default: str) -> str:
+        """读取元数据，不存在时写入默认值"""
+
+    @abstractmethod
+    def get_today_wife(self, qq: str, group: str, date: str) -> Optional[str]:
+        """查询用户某天的老婆"""
+
+    @abstractmethod
+    def save_wife(self, qq: str, wife: str, group: str, date: str) -> Tuple[str, bool]:
+        """保存抽取结果，返回 (最终生效的老婆QQ号, 是否由本次写入)"""
+
+    @abstractmethod
+    def save_wives(self, records: List[Tuple[str, str, str, str]]) -> int:
+        """批量保存抽取结果，返回实际写入的条数"""
+
+    @abstractmethod
+    def get_group_today_wives(self, group: str, date: str, page: int, page_size: int) -> Tuple[List[Tuple[str, str]], int]:
+        """分页查询某群某天的记录，返回 (记录列表, 总记录数)"""
+
+    @abstractmethod
+    def get_group_all_wives(self, group: str, date: str) -> List[Tuple[str, str]]:
+        """按抽取顺序查询某群某天的全部记录"""
+
+    @abstractmethod
+    def upsert_wife(self, qq: str, wife: str, group: str, date: str) -> Optional[str]:
+        """更新或插入记录，返回更新前的老婆QQ号"""
+
+    @abstractmethod
+    def upsert_wives(self, records: List[Tuple[str, str, str, str]]) -> Tuple[int, int]:
+        """批量更新或插入记录，返回 (更新的条数, 新建的条数)"""
+
+    @abstractmethod
+    def get_active_groups(self, since: str) -> List[str]:
+        """查询指定日期以来有记录的群"""
+
+    @abstractmethod
+    def get_top_wives(self, group: str, since: Optional[str], limit: int) -> List[Tuple[str, int]]:
+        """查询群内被抽中次数最多的成员"""
+
+    @abstractmethod
+    def get_member_history(self, group: str, qq: str, limit: int) -> Optional[Dict[str, Any]]:
+        """查询成员的历史统计"""
+
+    @abstractmethod
+    def rebuild_stats(self):
+        """由全部历史记录重新计算统计"""
+
+    @abstractmethod
+    def archive_before(self, date: str) -> int:
+        """归档指定日期之前的记录，返回归档的记录数"""
+
+
 # 今日老婆数据库管理类
-class JrlpDatabase:
+class JrlpDatabase(JrlpStorage):
+    """今日老婆数据库（单文件SQLite存储）
+
+    插件加载时创建一次并长期持有。每个线程复用自己的连接，
+    数据库以WAL模式运行，表结构按 user_version 迁移，只在创建时执行一次。
+    """
+
+    # 按写入顺序（id）重新计算 (群, 日期) 内的序号，{where} 为限定 jrlp 行的条件。
+    # 先用窗口函数一次算出全部序号再按主键写回，避免逐行计数
+    _RENUMBER_SEQ_SQL = '''
+        DROP TABLE IF EXISTS temp.jrlp_seq;
+        CREATE TEMP TABLE jrlp_seq (id INTEGER PRIMARY KEY, seq INTEGER NOT NULL);
+        INSERT INTO temp.jrlp_seq (id, seq)
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY "group", date ORDER BY id) FROM main.jrlp WHERE {where};
+        UPDATE main.jrlp SET seq = (SELECT seq FROM temp.jrlp_seq WHERE temp.jrlp_seq.id = jrlp.id)
+            WHERE id IN (SELECT id FROM temp.jrlp_seq);
+        DROP TABLE temp.jrlp_seq;
+    '''
+
+    # 由历史记录（含归档）重新计算统计表，按天的计数只保留最近 STATS_DAILY_DAYS 天
+    _REBUILD_STATS_SQL = f'''
+        DELETE FROM jrlp_wife_daily;
+        DELETE FROM jrlp_wife_total;
+        DELETE FROM jrlp_pair_total;
+        DELETE FROM jrlp_user_total;
+        CREATE TEMP TABLE jrlp_all AS
+            SELECT "group", date, qq, wife FROM jrlp
+            UNION ALL
+            SELECT "group", date(day * 86400, 'unixepoch'), qq, wife FROM jrlp_archive;
+        INSERT INTO jrlp_wife_total ("group", wife, count)
+            SELECT "group", wife, COUNT(*) FROM jrlp_all GROUP BY "group", wife;
+        INSERT INTO jrlp_pair_total ("group", qq, wife, count)
+            SELECT "group", qq, wife, COUNT(*) FROM jrlp_all GROUP BY "group", qq, wife;
+        INSERT INTO jrlp_user_total ("group", qq, rolls, first_date, last_date)
+            SELECT "group", qq, COUNT(*), MIN(date), MAX(date) FROM jrlp_all GROUP BY "group", qq;
+        INSERT INTO jrlp_wife_daily ("group", date, wife, count)
+            SELECT "group", date, wife, COUNT(*) FROM jrlp_all
+            WHERE date >= date('now', 'localtime', '-{STATS_DAILY_DAYS} days')
+            GROUP BY "group", date, wife;
+        DROP TABLE jrlp_all;
+    '''
+
+    # 数据库迁移脚本，第i项执行后 user_version 变为 i+1
+    MIGRATIONS = [
+        # v1: 初始表结构
+        '''
+        CREATE TABLE IF NOT EXISTS jrlp (
+            id INTEGER PRIMARY KEY,
+            qq INTEGER NOT NULL,
+            wife INTEGER NOT NULL,
+            "group" INTEGER NOT NULL,
+            date TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jrlp_query ON jrlp(qq, "group", date);
+        ''',
+        # v2: 去除重复抽取记录（保留最早的一条），(qq, group, date) 改为唯一约束
+        '''
+        DELETE FROM jrlp WHERE id NOT IN (
+            SELECT MIN(id) FROM jrlp GROUP BY qq, "group", date
+        );
+        DROP INDEX IF EXISTS idx_jrlp_query;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jrlp_unique ON jrlp(qq, "group", date);
+        ''',
+        # v3: 历史记录归档表，日期以距1970-01-01的天数存储
+        '''
+        CREATE TABLE IF NOT EXISTS jrlp_archive (
+            "group" INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            qq INTEGER NOT NULL,
+            wife INTEGER NOT NULL,
+            PRIMARY KEY ("group", day, qq)
+        ) WITHOUT ROWID;
+        ''',
+        # v4: 插件元数据
+        '''
+        CREATE TABLE IF NOT EXISTS jrlp_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        ''',
+        # v5: 按 (群, 日期) 维护记录数和记录序号，用于按序号分页
+        '''
+        CREATE TABLE IF NOT EXISTS jrlp_daily (
+            "group" INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY ("group", date)
+        ) WITHOUT ROWID;
+        INSERT OR REPLACE INTO jrlp_daily ("group", date, total)
+            SELECT "group", date, COUNT(*) FROM jrlp GROUP BY "group", date;
+        ALTER TABLE jrlp ADD COLUMN seq INTEGER NOT NULL DEFAULT 0;
+        CREATE INDEX IF NOT EXISTS idx_jrlp_group_date ON jrlp("group", date, seq, qq, wife);
+        ''' + _RENUMBER_SEQ_SQL.format(where="1"),
+        # v6: 排行榜和个人记录使用的统计表，随抽取和修改在同一事务中更新
+        '''
+        CREATE TABLE IF NOT EXISTS jrlp_wife_daily (
+            "group" INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            wife INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY ("group", date, wife)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS jrlp_wife_total (
+            "group" INTEGER NOT NULL,
+            wife INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY ("group", wife)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_jrlp_wife_total_rank ON jrlp_wife_total("group", count);
+        CREATE TABLE IF NOT EXISTS jrlp_pair_total (
+            "group" INTEGER NOT NULL,
+            qq INTEGER NOT NULL,
+            wife INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY ("group", qq, wife)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS jrlp_user_total (
+            "group" INTEGER NOT NULL,
+            qq INTEGER NOT NULL,
+            rolls INTEGER NOT NULL,
+            first_date TEXT NOT NULL,
+            last_date TEXT NOT NULL,
+            PRIMARY KEY ("group", qq)
+        ) WITHOUT ROWID;
+        ''' + _REBUILD_STATS_SQL,
+    ]
+
+    # 等待写锁的最长时间（毫秒）
+    BUSY_TIMEOUT = 5000
+
     def __init__(self, db_path: Path):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
         self._init_db()
 
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接，不存在时创建"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT}")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
     def _init_db(self):
-        # 初始化数据库表结构
-        with sqlite3.connect(self.db_path) as conn:
+        # 开启增量空间回收和WAL，并执行未完成的迁移
+        conn = self._connect()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # 已有数据的数据库需要完整VACUUM一次才能切换为增量回收
+            logger.info("正在整理数据库以启用增量空间回收")
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA journal_mode = WAL")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, script in enumerate(self.MIGRATIONS[version:], start=version + 1):
+            with conn:
+                conn.executescript(f"BEGIN; {script}; PRAGMA user_version = {target};")
+            logger.info(f"数据库已迁移到版本 {target}")
+
+    def close(self):
+        """关闭所有线程的数据库连接"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def ensure_meta(self, key: str, default: str) -> str:
+        """读取元数据，不存在时写入默认值
+
+        Args:
+            key: 元数据名
+            default: 不存在时写入的值
+
+        Returns:
+            数据库中的值
+        """
+        conn = self._connect()
+        with conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS jrlp (
-                    id INTEGER PRIMARY KEY,
-                    qq INTEGER NOT NULL,
-                    wife INTEGER NOT NULL,
-                    "group" INTEGER NOT NULL,
-                    date TEXT NOT NULL
-                )
-            ''')
-            # 添加索引优化查询
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_jrlp_query 
-                ON jrlp(qq, "group", date)
-            ''')
-            conn.commit()
+            cursor.execute('INSERT OR IGNORE INTO jrlp_meta (key, value) VALUES (?, ?)', (key, default))
+            cursor.execute('SELECT value FROM jrlp_meta WHERE key = ?', (key,))
+            return cursor.fetchone()[0]
 
+    @_timed("db.get_today_wife")
     def get_today_wife(self, qq: str, group: str, date: str) -> Optional[str]:
         """查询用户今日是否已抽取老婆
 
@@ -248,7 +2209,8 @@ class JrlpDatabase:
         Returns:
             老婆的QQ号，如果未抽取过则返回None
         """
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._connect()
+        with conn:
             cursor = conn.cursor()
             cursor.execute(
                 'SELECT wife FROM jrlp WHERE qq = ? AND "group" = ? AND date = ?',
@@ -257,26 +2219,119 @@ class JrlpDatabase:
             result = cursor.fetchone()
             return str(result[0]) if result else None
 
-    def save_wife(self, qq: str, wife: str, group: str, date: str):
-        """保存抽取结果
+    # 插入抽取记录，序号为当天该群已有记录数+1，需要拼接 ON CONFLICT 的处理方式
+    _INSERT_ROLL_SQL = (
+        'INSERT INTO jrlp (qq, wife, "group", date, seq) VALUES (?, ?, ?, ?, '
+        'COALESCE((SELECT total FROM jrlp_daily WHERE "group" = ? AND date = ?), 0) + 1) '
+        'ON CONFLICT (qq, "group", date)'
+    )
+
+    @staticmethod
+    def _insert_roll(cursor: sqlite3.Cursor, qq: str, wife: str, group: str, date: str) -> bool:
+        """插入一条抽取记录并维护当天序号，记录已存在时不做修改
+
+        Returns:
+            是否插入了新记录
+        """
+        params = (int(qq), int(wife), int(group), date, int(group), date)
+        sql = JrlpDatabase._INSERT_ROLL_SQL + ' DO NOTHING'
+        if _SQLITE_HAS_RETURNING:
+            cursor.execute(sql + ' RETURNING id', params)
+            inserted = cursor.fetchone() is not None
+        else:
+            cursor.execute(sql, params)
+            inserted = cursor.rowcount == 1
+        if inserted:
+            JrlpDatabase._count_roll(cursor, group, date)
+            JrlpDatabase._count_user(cursor, qq, group, date)
+            JrlpDatabase._count_wife(cursor, qq, wife, group, date, 1)
+        return inserted
+
+    @staticmethod
+    def _count_roll(cursor: sqlite3.Cursor, group: str, date: str):
+        # 新记录的序号取自 jrlp_daily，写入后同步增加当天记录数
+        cursor.execute(
+            'INSERT INTO jrlp_daily ("group", date, total) VALUES (?, ?, 1) '
+            'ON CONFLICT ("group", date) DO UPDATE SET total = total + 1',
+            (int(group), date)
+        )
+
+    @staticmethod
+    def _count_user(cursor: sqlite3.Cursor, qq: str, group: str, date: str):
+        # 成员新增一条抽取记录
+        cursor.execute(
+            'INSERT INTO jrlp_user_total ("group", qq, rolls, first_date, last_date) VALUES (?, ?, 1, ?, ?) '
+            'ON CONFLICT ("group", qq) DO UPDATE SET rolls = rolls + 1, last_date = MAX(last_date, excluded.last_date)',
+            (int(group), int(qq), date, date)
+        )
+
+    @staticmethod
+    def _count_wife(cursor: sqlite3.Cursor, qq: str, wife: str, group: str, date: str, delta: int):
+        # 调整老婆被抽中的次数，delta为-1时（管理员修改）清理减到0的计数
+        keys = (
+            ("jrlp_wife_daily", '"group", date, wife', (int(group), date, int(wife))),
+            ("jrlp_wife_total", '"group", wife', (int(group), int(wife))),
+            ("jrlp_pair_total", '"group", qq, wife', (int(group), int(qq), int(wife))),
+        )
+        for table, columns, params in keys:
+            placeholders = ", ".join("?" * len(params))
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}, count) VALUES ({placeholders}, ?) '
+                f'ON CONFLICT ({columns}) DO UPDATE SET count = count + excluded.count',
+                params + (delta,)
+            )
+            if delta < 0:
+                conditions = " AND ".join(f"{column.strip()} = ?" for column in columns.split(","))
+                cursor.execute(f'DELETE FROM {table} WHERE {conditions} AND count <= 0', params)
+
+    @_timed("db.save_wife")
+    def save_wife(self, qq: str, wife: str, group: str, date: str) -> Tuple[str, bool]:
+        """保存抽取结果，同一用户同一天只有第一次保存生效
 
         Args:
             qq: 用户QQ号
             wife: 老婆的QQ号
             group: 群号
             date: 日期 (YYYY-MM-DD格式)
+
+        Returns:
+            (最终生效的老婆QQ号, 是否由本次写入)
         """
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._connect()
+        with conn:
             cursor = conn.cursor()
+            if self._insert_roll(cursor, qq, wife, group, date):
+                return wife, True
+
+            # 已有记录（如用户连续发送命令），返回先写入的结果
             cursor.execute(
-                'INSERT INTO jrlp (qq, wife, "group", date) VALUES (?, ?, ?, ?)',
-                (int(qq), int(wife), int(group), date)
+                'SELECT wife FROM jrlp WHERE qq = ? AND "group" = ? AND date = ?',
+                (int(qq), int(group), date)
             )
-            conn.commit()
+            return str(cursor.fetchone()[0]), False
+
+    @_timed("db.save_wives")
+    def save_wives(self, records: List[Tuple[str, str, str, str]]) -> int:
+        """在一个事务中批量保存抽取结果，已存在的记录保持不变
+
+        Args:
+            records: [(qq, wife, group, date), ...]
 
+        Returns:
+            实际写入的条数
+        """
+        conn = self._connect()
+        with conn:
+            cursor = conn.cursor()
+            return sum(self._insert_roll(cursor, qq, wife, group, date) for qq, wife, group, date in records)
+
+    @_timed("db.get_group_today_wives")
     def get_group_today_wives(self, group: str, date: str, page: int, page_size: int) -> Tuple[List[Tuple[str, str]], int]:
         """分页查询某群今日所有老婆记录
 
+        同一群同一天的记录序号从1连续递增，第page页即序号在
+        ((page-1)*page_size, page*page_size] 范围内的记录，任意页都只需一次索引查找。
+
         Args:
             group: 群号
             date: 日期 (YYYY-MM-DD格式)
@@ -286,25 +2341,168 @@ class JrlpDatabase:
         Returns:
             (记录列表[(qq, wife), ...], 总记录数)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            # 查询总数
-            cursor.execute(
-                'SELECT COUNT(*) FROM jrlp WHERE "group" = ? AND date = ?',
-                (int(group), date)
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT total FROM jrlp_daily WHERE "group" = ? AND date = ?',
+            (int(group), date)
+        )
+        row = cursor.fetchone()
+        total = row[0] if row else 0
+
+        cursor.execute(
+            'SELECT qq, wife FROM jrlp WHERE "group" = ? AND date = ? AND seq > ? ORDER BY seq LIMIT ?',
+            (int(group), date, (page - 1) * page_size, page_size)
+        )
+        records = [(str(qq), str(wife)) for qq, wife in cursor.fetchall()]
+        return records, total
+
+    @_timed("db.get_group_all_wives")
+    def get_group_all_wives(self, group: str, date: str) -> List[Tuple[str, str]]:
+        """按抽取顺序查询某群今日的全部记录，只扫描一次覆盖索引
+
+        Returns:
+            记录列表[(qq, wife), ...]
+        """
+        conn = self._connect()
+        cursor = conn.execute(
+            'SELECT qq, wife FROM jrlp WHERE "group" = ? AND date = ? ORDER BY seq',
+            (int(group), date)
+        )
+        return [(str(qq), str(wife)) for qq, wife in cursor]
+
+    @_timed("db.get_top_wives")
+    def get_top_wives(self, group: str, since: Optional[str], limit: int) -> List[Tuple[str, int]]:
+        """查询群内被抽中次数最多的成员，只读取统计表
+
+        Args:
+            group: 群号
+            since: 起始日期 (YYYY-MM-DD格式)，None表示全部历史
+            limit: 返回人数
+
+        Returns:
+            [(QQ号, 次数), ...]，按次数从多到少排列
+        """
+        conn = self._connect()
+        if since is None:
+            cursor = conn.execute(
+                'SELECT wife, count FROM jrlp_wife_total WHERE "group" = ? ORDER BY count DESC, wife LIMIT ?',
+                (int(group), limit)
+            )
+        else:
+            cursor = conn.execute(
+                'SELECT wife, SUM(count) AS total FROM jrlp_wife_daily WHERE "group" = ? AND date >= ? '
+                'GROUP BY wife ORDER BY total DESC, wife LIMIT ?',
+                (int(group), since, limit)
             )
-            total = cursor.fetchone()[0]
+        return [(str(wife), count) for wife, count in cursor]
+
+    @_timed("db.get_member_history")
+    def get_member_history(self, group: str, qq: str, limit: int) -> Optional[Dict[str, Any]]:
+        """查询成员的历史统计，只读取统计表
+
+        Returns:
+            {"rolls", "first_date", "last_date", "chosen", "favorites": [(QQ号, 次数), ...]}，
+            成员从未抽取过也从未被抽中时返回None
+        """
+        conn = self._connect()
+        user = conn.execute(
+            'SELECT rolls, first_date, last_date FROM jrlp_user_total WHERE "group" = ? AND qq = ?',
+            (int(group), int(qq))
+        ).fetchone()
+        chosen = conn.execute(
+            'SELECT count FROM jrlp_wife_total WHERE "group" = ? AND wife = ?',
+            (int(group), int(qq))
+        ).fetchone()
+        if user is None and chosen is None:
+            return None
+        favorites = conn.execute(
+            'SELECT wife, count FROM jrlp_pair_total WHERE "group" = ? AND qq = ? ORDER BY count DESC, wife LIMIT ?',
+            (int(group), int(qq), limit)
+        ).fetchall()
+        return {
+            "rolls": user[0] if user else 0,
+            "first_date": user[1] if user else None,
+            "last_date": user[2] if user else None,
+            "chosen": chosen[0] if chosen else 0,
+            "favorites": [(str(wife), count) for wife, count in favorites],
+        }
+
+    @_timed("db.rebuild_stats")
+    def rebuild_stats(self):
+        """由全部历史记录重新计算统计表"""
+        conn = self._connect()
+        with conn:
+            conn.executescript(f"BEGIN; {self._REBUILD_STATS_SQL}")
+
+    @_timed("db.get_active_groups")
+    def get_active_groups(self, since: str) -> List[str]:
+        """查询指定日期以来有抽取记录的群
+
+        Args:
+            since: 起始日期 (YYYY-MM-DD格式)
+
+        Returns:
+            群号列表
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT "group" FROM jrlp_daily WHERE date >= ?', (since,))
+        return [str(group) for group, in cursor.fetchall()]
 
-            # 分页查询
-            offset = (page - 1) * page_size
+    @_timed("db.archive_before")
+    def archive_before(self, date: str) -> int:
+        """把指定日期之前的记录移入归档表并回收空闲页
+
+        Args:
+            date: 截止日期 (YYYY-MM-DD格式)，早于该日期的记录会被归档
+
+        Returns:
+            归档的记录数
+        """
+        conn = self._connect()
+        with conn:
+            cursor = conn.cursor()
             cursor.execute(
-                'SELECT qq, wife FROM jrlp WHERE "group" = ? AND date = ? LIMIT ? OFFSET ?',
-                (int(group), date, page_size, offset)
+                'INSERT OR REPLACE INTO jrlp_archive ("group", day, qq, wife) '
+                'SELECT "group", CAST(julianday(date) - julianday(\'1970-01-01\') AS INTEGER), qq, wife '
+                'FROM jrlp WHERE date < ?',
+                (date,)
             )
-            records = [(str(qq), str(wife)) for qq, wife in cursor.fetchall()]
-            return records, total
+            cursor.execute('DELETE FROM jrlp WHERE date < ?', (date,))
+            archived = cursor.rowcount
+            cursor.execute('DELETE FROM jrlp_daily WHERE date < ?', (date,))
+            # 按天的老婆计数只保留 /jrlp top 用得到的天数，总计数不受归档影响
+            stats_cutoff = (datetime.date.today() - datetime.timedelta(days=STATS_DAILY_DAYS)).isoformat()
+            cursor.execute('DELETE FROM jrlp_wife_daily WHERE date < ?', (stats_cutoff,))
+        if archived:
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+        return archived
 
-    def upsert_wife(self, qq: str, wife: str, group: str, date: str) -> bool:
+    @staticmethod
+    def _upsert_roll(cursor: sqlite3.Cursor, qq: str, wife: str, group: str, date: str) -> Optional[str]:
+        """更新或插入一条记录，返回更新前的老婆QQ号，插入新记录时返回None"""
+        cursor.execute(
+            'SELECT wife FROM jrlp WHERE qq = ? AND "group" = ? AND date = ?',
+            (int(qq), int(group), date)
+        )
+        existing = cursor.fetchone()
+        cursor.execute(
+            JrlpDatabase._INSERT_ROLL_SQL + ' DO UPDATE SET wife = excluded.wife',
+            (int(qq), int(wife), int(group), date, int(group), date)
+        )
+        if existing:
+            if existing[0] != int(wife):
+                JrlpDatabase._count_wife(cursor, qq, str(existing[0]), group, date, -1)
+                JrlpDatabase._count_wife(cursor, qq, wife, group, date, 1)
+            return str(existing[0])
+        JrlpDatabase._count_roll(cursor, group, date)
+        JrlpDatabase._count_user(cursor, qq, group, date)
+        JrlpDatabase._count_wife(cursor, qq, wife, group, date, 1)
+        return None
+
+    @_timed("db.upsert_wife")
+    def upsert_wife(self, qq: str, wife: str, group: str, date: str) -> Optional[str]:
         """更新或插入老婆记录
 
         Args:
@@ -314,33 +2512,595 @@ class JrlpDatabase:
             date: 日期 (YYYY-MM-DD格式)
 
         Returns:
-            bool: True表示更新了已有记录，False表示插入了新记录
+            更新前的老婆QQ号，插入新记录时返回None
+        """
+        conn = self._connect()
+        with conn:
+            return self._upsert_roll(conn.cursor(), qq, wife, group, date)
+
+    @_timed("db.upsert_wives")
+    def upsert_wives(self, records: List[Tuple[str, str, str, str]]) -> Tuple[int, int]:
+        """在一个事务中批量更新或插入老婆记录，任意一条失败时全部回滚
+
+        Args:
+            records: [(qq, wife, group, date), ...]
+
+        Returns:
+            (更新的条数, 新建的条数)
         """
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._connect()
+        with conn:
             cursor = conn.cursor()
-            # 检查是否存在记录
-            cursor.execute(
-                'SELECT id FROM jrlp WHERE qq = ? AND "group" = ? AND date = ?',
-                (int(qq), int(group), date)
-            )
-            existing = cursor.fetchone()
+            updated = sum(self._upsert_roll(cursor, qq, wife, group, date) is not None
+                          for qq, wife, group, date in records)
+        return updated, len(records) - updated
+
+
+# 按群分片的SQLite存储
+class ShardedJrlpDatabase(JrlpStorage):
+    """按群号哈希把数据分散到多个SQLite文件
+
+    每个分片都是一个完整的 JrlpDatabase，同一个群的所有数据都在同一个分片中，
+    不同分片各有自己的写锁和写线程，多个群同时抽取时互不等待。元数据保存在第0个分片中。
+    """
+
+    def __init__(self, directory: Path, shards: int):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.shards = [JrlpDatabase(directory / f"jrlp_{i}.db") for i in range(max(1, shards))]
+        self.write_lanes = len(self.shards)
+
+    @staticmethod
+    def shard_of(group: Union[int, str], shards: int) -> int:
+        """群号所在的分片，哈希结果不随进程变化"""
+        return zlib.crc32(str(int(group)).encode("ascii")) % shards
+
+    def write_lane(self, group: str) -> int:
+        return self.shard_of(group, len(self.shards))
+
+    def _shard(self, group: str) -> JrlpDatabase:
+        return self.shards[self.write_lane(group)]
+
+    def lane_storage(self, lane: int) -> JrlpStorage:
+        return self.shards[lane]
+
+    def _partition(self, records: List[Tuple[str, str, str, str]]) -> Dict[int, List[Tuple[str, str, str, str]]]:
+        partitions: Dict[int, List[Tuple[str, str, str, str]]] = {}
+        for record in records:
+            partitions.setdefault(self.write_lane(record[2]), []).append(record)
+        return partitions
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def ensure_meta(self, key: str, default: str) -> str:
+        return self.shards[0].ensure_meta(key, default)
+
+    def get_today_wife(self, qq: str, group: str, date: str) -> Optional[str]:
+        return self._shard(group).get_today_wife(qq, group, date)
 
-            if existing:
-                # 更新已有记录
-                cursor.execute(
-                    'UPDATE jrlp SET wife = ? WHERE qq = ? AND "group" = ? AND date = ?',
-                    (int(wife), int(qq), int(group), date)
+    def save_wife(self, qq: str, wife: str, group: str, date: str) -> Tuple[str, bool]:
+        return self._shard(group).save_wife(qq, wife, group, date)
+
+    def save_wives(self, records: List[Tuple[str, str, str, str]]) -> int:
+        # 每个分片各自一个事务
+        return sum(self.shards[lane].save_wives(part) for lane, part in self._partition(records).items())
+
+    def get_group_today_wives(self, group: str, date: str, page: int, page_size: int) -> Tuple[List[Tuple[str, str]], int]:
+        return self._shard(group).get_group_today_wives(group, date, page, page_size)
+
+    def get_group_all_wives(self, group: str, date: str) -> List[Tuple[str, str]]:
+        return self._shard(group).get_group_all_wives(group, date)
+
+    def upsert_wife(self, qq: str, wife: str, group: str, date: str) -> Optional[str]:
+        return self._shard(group).upsert_wife(qq, wife, group, date)
+
+    def upsert_wives(self, records: List[Tuple[str, str, str, str]]) -> Tuple[int, int]:
+        updated = created = 0
+        for lane, part in self._partition(records).items():
+            part_updated, part_created = self.shards[lane].upsert_wives(part)
+            updated += part_updated
+            created += part_created
+        return updated, created
+
+    def get_active_groups(self, since: str) -> List[str]:
+        groups = set()
+        for shard in self.shards:
+            groups.update(shard.get_active_groups(since))
+        return sorted(groups)
+
+    def get_top_wives(self, group: str, since: Optional[str], limit: int) -> List[Tuple[str, int]]:
+        return self._shard(group).get_top_wives(group, since, limit)
+
+    def get_member_history(self, group: str, qq: str, limit: int) -> Optional[Dict[str, Any]]:
+        return self._shard(group).get_member_history(group, qq, limit)
+
+    def rebuild_stats(self):
+        for shard in self.shards:
+            shard.rebuild_stats()
+
+    def archive_before(self, date: str) -> int:
+        return sum(shard.archive_before(date) for shard in self.shards)
+
+    def prepare_import(self, source: Path) -> Path:
+        """复制一份待导入的文件并把副本迁移到最新版本，源文件保持不变
+
+        Returns:
+            副本路径，导入完成后用 discard_import 删除
+        """
+        copy = self.directory / f".import_{secrets.token_hex(4)}.db"
+        # 用备份接口复制，源文件处于WAL模式时也能得到一致的快照
+        with contextlib.closing(sqlite3.connect(f"{source.absolute().as_uri()}?mode=ro", uri=True)) as src, \
+                contextlib.closing(sqlite3.connect(copy)) as dst:
+            src.backup(dst)
+        JrlpDatabase(copy).close()
+        return copy
+
+    @staticmethod
+    def discard_import(copy: Path):
+        """删除 prepare_import 生成的副本"""
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{copy}{suffix}").unlink(missing_ok=True)
+
+    def import_shard(self, source: Path, index: int) -> int:
+        """把源文件中属于第index个分片的记录写入该分片，需要在该分片的写线程上执行
+
+        只复制抽取记录和归档记录，分片中已有的同一条记录（同一用户同一天）保持不变，
+        重复执行不会再写入任何记录。当天序号、每日记录数和统计表由合并后的记录重新计算。
+
+        Returns:
+            复制的抽取记录数（含归档）
+        """
+        shards = len(self.shards)
+        shard = self.shards[index]
+        conn = shard._connect()
+        conn.create_function("jrlp_shard", 1, lambda group: self.shard_of(group, shards), deterministic=True)
+        conn.execute("ATTACH DATABASE ? AS source", (str(source),))
+        try:
+            with conn:
+                conn.execute('DROP TABLE IF EXISTS temp.jrlp_import_days')
+                conn.execute(
+                    'CREATE TEMP TABLE jrlp_import_days AS '
+                    'SELECT DISTINCT "group", date FROM source.jrlp WHERE jrlp_shard("group") = ?',
+                    (index,)
                 )
-                conn.commit()
-                return True
+                # 导入的记录排在分片已有记录之后，按源文件中的顺序编号
+                rolls = conn.execute(
+                    'INSERT OR IGNORE INTO main.jrlp (qq, wife, "group", date) '
+                    'SELECT qq, wife, "group", date FROM source.jrlp WHERE jrlp_shard("group") = ? '
+                    'ORDER BY "group", date, seq',
+                    (index,)
+                ).rowcount
+                archived = conn.execute(
+                    'INSERT OR IGNORE INTO main.jrlp_archive ("group", day, qq, wife) '
+                    'SELECT "group", day, qq, wife FROM source.jrlp_archive WHERE jrlp_shard("group") = ?',
+                    (index,)
+                ).rowcount
+                if rolls:
+                    days = '("group", date) IN (SELECT "group", date FROM temp.jrlp_import_days)'
+                    for statement in JrlpDatabase._RENUMBER_SEQ_SQL.format(where=days).split(";"):
+                        if statement.strip():
+                            conn.execute(statement)
+                    conn.execute(f'''
+                        INSERT OR REPLACE INTO main.jrlp_daily ("group", date, total)
+                        SELECT "group", date, COUNT(*) FROM main.jrlp WHERE {days} GROUP BY "group", date
+                    ''')
+                conn.execute('DROP TABLE temp.jrlp_import_days')
+                conn.execute('INSERT OR IGNORE INTO main.jrlp_meta (key, value) SELECT key, value FROM source.jrlp_meta')
+        finally:
+            conn.execute("DETACH DATABASE source")
+        if rolls or archived:
+            shard.rebuild_stats()
+        return rolls + archived
+
+
+# 内存存储
+class MemoryJrlpStorage(JrlpStorage):
+    """纯内存存储，进程退出后数据丢失，用于测试和基准测试
+
+    行为与 JrlpDatabase 一致：同一用户同一天只有第一次保存生效，记录按写入顺序编号，
+    统计随写入同步更新。所有操作在一把锁内完成。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (群号, 日期) -> {QQ号: 老婆QQ号}，按写入顺序排列
+        self._days: Dict[Tuple[str, str], "OrderedDict[str, str]"] = {}
+        self._archive: Dict[Tuple[str, str], "OrderedDict[str, str]"] = {}
+        self._meta: Dict[str, str] = {}
+        self._wife_daily: Dict[Tuple[str, str, str], int] = {}
+        self._wife_total: Dict[Tuple[str, str], int] = {}
+        self._pair_total: Dict[Tuple[str, str, str], int] = {}
+        # (群号, QQ号) -> [抽取次数, 首次日期, 最近日期]
+        self._user_total: Dict[Tuple[str, str], List[Any]] = {}
+
+    def close(self):
+        pass
+
+    def ensure_meta(self, key: str, default: str) -> str:
+        with self._lock:
+            return self._meta.setdefault(key, default)
+
+    @staticmethod
+    def _add(counter: Dict[Any, int], key: Any, delta: int):
+        value = counter.get(key, 0) + delta
+        if value > 0:
+            counter[key] = value
+        else:
+            counter.pop(key, None)
+
+    def _count_wife(self, qq: str, wife: str, group: str, date: str, delta: int):
+        self._add(self._wife_daily, (group, date, wife), delta)
+        self._add(self._wife_total, (group, wife), delta)
+        self._add(self._pair_total, (group, qq, wife), delta)
+
+    def _count_user(self, qq: str, group: str, date: str):
+        user = self._user_total.get((group, qq))
+        if user is None:
+            self._user_total[(group, qq)] = [1, date, date]
+        else:
+            user[0] += 1
+            user[2] = max(user[2], date)
+
+    def _insert_roll(self, qq: str, wife: str, group: str, date: str) -> bool:
+        day = self._days.setdefault((group, date), OrderedDict())
+        if qq in day:
+            return False
+        day[qq] = wife
+        self._count_user(qq, group, date)
+        self._count_wife(qq, wife, group, date, 1)
+        return True
+
+    def _upsert_roll(self, qq: str, wife: str, group: str, date: str) -> Optional[str]:
+        day = self._days.setdefault((group, date), OrderedDict())
+        previous = day.get(qq)
+        if previous is None:
+            self._insert_roll(qq, wife, group, date)
+            return None
+        if previous != wife:
+            # 修改不改变记录的顺序
+            day[qq] = wife
+            self._count_wife(qq, previous, group, date, -1)
+            self._count_wife(qq, wife, group, date, 1)
+        return previous
+
+    @_timed("db.get_today_wife")
+    def get_today_wife(self, qq: str, group: str, date: str) -> Optional[str]:
+        with self._lock:
+            day = self._days.get((group, date))
+            return day.get(qq) if day else None
+
+    @_timed("db.save_wife")
+    def save_wife(self, qq: str, wife: str, group: str, date: str) -> Tuple[str, bool]:
+        with self._lock:
+            if self._insert_roll(qq, wife, group, date):
+                return wife, True
+            return self._days[(group, date)][qq], False
+
+    @_timed("db.save_wives")
+    def save_wives(self, records: List[Tuple[str, str, str, str]]) -> int:
+        with self._lock:
+            return sum(self._insert_roll(qq, wife, group, date) for qq, wife, group, date in records)
+
+    @_timed("db.get_group_today_wives")
+    def get_group_today_wives(self, group: str, date: str, page: int, page_size: int) -> Tuple[List[Tuple[str, str]], int]:
+        with self._lock:
+            day = self._days.get((group, date)) or {}
+            start = (page - 1) * page_size
+            return list(itertools.islice(day.items(), start, start + page_size)), len(day)
+
+    @_timed("db.get_group_all_wives")
+    def get_group_all_wives(self, group: str, date: str) -> List[Tuple[str, str]]:
+        with self._lock:
+            return list((self._days.get((group, date)) or {}).items())
+
+    @_timed("db.upsert_wife")
+    def upsert_wife(self, qq: str, wife: str, group: str, date: str) -> Optional[str]:
+        with self._lock:
+            return self._upsert_roll(qq, wife, group, date)
+
+    @_timed("db.upsert_wives")
+    def upsert_wives(self, records: List[Tuple[str, str, str, str]]) -> Tuple[int, int]:
+        with self._lock:
+            updated = sum(self._upsert_roll(qq, wife, group, date) is not None for qq, wife, group, date in records)
+        return updated, len(records) - updated
+
+    @_timed("db.get_active_groups")
+    def get_active_groups(self, since: str) -> List[str]:
+        with self._lock:
+            return sorted({group for (group, date), day in self._days.items() if date >= since and day})
+
+    @_timed("db.get_top_wives")
+    def get_top_wives(self, group: str, since: Optional[str], limit: int) -> List[Tuple[str, int]]:
+        with self._lock:
+            if since is None:
+                counts = {wife: count for (g, wife), count in self._wife_total.items() if g == group}
             else:
-                # 插入新记录
-                cursor.execute(
-                    'INSERT INTO jrlp (qq, wife, "group", date) VALUES (?, ?, ?, ?)',
-                    (int(qq), int(wife), int(group), date)
-                )
-                conn.commit()
-                return False
+                counts: Dict[str, int] = {}
+                for (g, date, wife), count in self._wife_daily.items():
+                    if g == group and date >= since:
+                        counts[wife] = counts.get(wife, 0) + count
+        return sorted(counts.items(), key=lambda item: (-item[1], int(item[0])))[:limit]
+
+    @_timed("db.get_member_history")
+    def get_member_history(self, group: str, qq: str, limit: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user = self._user_total.get((group, qq))
+            chosen = self._wife_total.get((group, qq), 0)
+            if user is None and not chosen:
+                return None
+            favorites = sorted(
+                ((wife, count) for (g, q, wife), count in self._pair_total.items() if g == group and q == qq),
+                key=lambda item: (-item[1], int(item[0]))
+            )[:limit]
+        return {
+            "rolls": user[0] if user else 0,
+            "first_date": user[1] if user else None,
+            "last_date": user[2] if user else None,
+            "chosen": chosen,
+            "favorites": favorites,
+        }
+
+    @_timed("db.rebuild_stats")
+    def rebuild_stats(self):
+        stats_cutoff = (datetime.date.today() - datetime.timedelta(days=STATS_DAILY_DAYS)).isoformat()
+        with self._lock:
+            self._wife_daily.clear()
+            self._wife_total.clear()
+            self._pair_total.clear()
+            self._user_total.clear()
+            for source in (self._archive, self._days):
+                for (group, date), day in source.items():
+                    for qq, wife in day.items():
+                        self._count_user(qq, group, date)
+                        self._count_wife(qq, wife, group, date, 1)
+            for key in [key for key in self._wife_daily if key[1] < stats_cutoff]:
+                del self._wife_daily[key]
+
+    @_timed("db.archive_before")
+    def archive_before(self, date: str) -> int:
+        stats_cutoff = (datetime.date.today() - datetime.timedelta(days=STATS_DAILY_DAYS)).isoformat()
+        archived = 0
+        with self._lock:
+            for key in [key for key in self._days if key[1] < date]:
+                day = self._days.pop(key)
+                self._archive.setdefault(key, OrderedDict()).update(day)
+                archived += len(day)
+            for key in [key for key in self._wife_daily if key[1] < stats_cutoff]:
+                del self._wife_daily[key]
+        return archived
+
+
+# 数据库异步封装
+class AsyncJrlpDatabase:
+    """JrlpStorage 的异步封装
+
+    写操作按存储的写通道提交到专用写线程串行执行（单文件存储只有一个通道，
+    分片存储每个分片一个通道），读操作提交到小型读线程池，
+    WAL模式下读写互不阻塞，事件循环只等待结果而不执行任何sqlite调用。
+    """
+
+    def __init__(self, db: JrlpStorage, readers: int = 2):
+        self.db = db
+        self._writers = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"jrlp-db-writer-{lane}")
+            for lane in range(db.write_lanes)
+        ]
+        self._readers = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="jrlp-db-reader")
+
+    @staticmethod
+    async def _run(executor: Optional[ThreadPoolExecutor], func: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+    def _writer(self, group: str) -> ThreadPoolExecutor:
+        return self._writers[self.db.write_lane(group)]
+
+    def _partition(self, records: List[Tuple[str, str, str, str]]) -> Dict[int, List[Tuple[str, str, str, str]]]:
+        # 批量写入按写通道拆分，各通道并行提交
+        partitions: Dict[int, List[Tuple[str, str, str, str]]] = {}
+        for record in records:
+            partitions.setdefault(self.db.write_lane(record[2]), []).append(record)
+        return partitions
+
+    async def get_today_wife(self, qq: str, group: str, date: str) -> Optional[str]:
+        return await self._run(self._readers, self.db.get_today_wife, qq, group, date)
+
+    async def save_wife(self, qq: str, wife: str, group: str, date: str) -> Tuple[str, bool]:
+        return await self._run(self._writer(group), self.db.save_wife, qq, wife, group, date)
+
+    async def get_group_today_wives(self, group: str, date: str, page: int, page_size: int) -> Tuple[List[Tuple[str, str]], int]:
+        return await self._run(self._readers, self.db.get_group_today_wives, group, date, page, page_size)
+
+    async def get_group_all_wives(self, group: str, date: str) -> List[Tuple[str, str]]:
+        return await self._run(self._readers, self.db.get_group_all_wives, group, date)
+
+    async def save_wives(self, records: List[Tuple[str, str, str, str]]) -> int:
+        results = await asyncio.gather(*(
+            self._run(self._writers[lane], self.db.save_wives, part) for lane, part in self._partition(records).items()
+        ))
+        return sum(results)
+
+    async def upsert_wife(self, qq: str, wife: str, group: str, date: str) -> Optional[str]:
+        return await self._run(self._writer(group), self.db.upsert_wife, qq, wife, group, date)
+
+    async def upsert_wives(self, records: List[Tuple[str, str, str, str]]) -> Tuple[int, int]:
+        results = await asyncio.gather(*(
+            self._run(self._writers[lane], self.db.upsert_wives, part) for lane, part in self._partition(records).items()
+        ))
+        return sum(updated for updated, _ in results), sum(created for _, created in results)
+
+    async def get_active_groups(self, since: str) -> List[str]:
+        return await self._run(self._readers, self.db.get_active_groups, since)
+
+    async def get_top_wives(self, group: str, since: Optional[str], limit: int) -> List[Tuple[str, int]]:
+        return await self._run(self._readers, self.db.get_top_wives, group, since, limit)
+
+    async def get_member_history(self, group: str, qq: str, limit: int) -> Optional[Dict[str, Any]]:
+        return await self._run(self._readers, self.db.get_member_history, group, qq, limit)
+
+    async def _each_lane(self, method: str, *args) -> List[Any]:
+        # 全库操作拆成每个通道的部分，各自在该通道的写线程上执行，保证每个文件只有一个写线程
+        return await asyncio.gather(*(
+            self._run(writer, getattr(self.db.lane_storage(lane), method), *args)
+            for lane, writer in enumerate(self._writers)
+        ))
+
+    async def rebuild_stats(self):
+        await self._each_lane("rebuild_stats")
+
+    async def archive_before(self, date: str) -> int:
+        return sum(await self._each_lane("archive_before", date))
+
+    async def import_files(self, sources: List[Path]) -> int:
+        """把其它SQLite文件导入分片存储，每个分片的部分在该分片的写线程上执行"""
+        copied = 0
+        for source in sources:
+            # 迁移和导入都在副本上进行，源文件保持不变
+            copy = await self._run(None, self.db.prepare_import, source)
+            try:
+                copied += sum(await asyncio.gather(*(
+                    self._run(writer, self.db.import_shard, copy, lane) for lane, writer in enumerate(self._writers)
+                )))
+            finally:
+                await self._run(None, self.db.discard_import, copy)
+        return copied
+
+    async def close(self):
+        """等待排队中的操作完成后关闭线程池和数据库连接"""
+        await asyncio.get_running_loop().run_in_executor(None, self._close)
+
+    def _close(self):
+        for writer in self._writers:
+            writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.db.close()
+
+
+# 抽取结果延迟写入
+class WriteBehindDatabase:
+    """在 AsyncJrlpDatabase 之上延迟批量写入抽取结果
+
+    save_wife 只把结果放进内存中的待写入表，读取时优先查询待写入表；
+    后台任务在积压达到flush_batch_size或每隔flush_interval秒时，
+    把待写入的结果合并到一个事务中提交。关闭时会把剩余结果全部写入。
+    """
+
+    def __init__(self, db: AsyncJrlpDatabase, flush_interval: float = 1.0, flush_batch_size: int = 200):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self._pending: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"批量写入抽取结果失败，稍后重试: {e}", exc_info=True)
+
+    async def flush(self):
+        """把当前所有待写入的结果提交到数据库"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._pending:
+                batch = list(self._pending.items())[:self.flush_batch_size]
+                records = [(qq, wife, group, date) for (qq, group, date), wife in batch]
+                written = await self.db.save_wives(records)
+                if written < len(records):
+                    logger.warning(f"批量写入时有 {len(records) - written} 条结果已存在于数据库，以数据库为准")
+                # 提交成功后才移出待写入表，期间的读取仍能命中内存中的结果
+                for key, wife in batch:
+                    if self._pending.get(key) == wife:
+                        del self._pending[key]
+
+    async def get_today_wife(self, qq: str, group: str, date: str) -> Optional[str]:
+        pending = self._pending.get((qq, group, date))
+        if pending is not None:
+            return pending
+        return await self.db.get_today_wife(qq, group, date)
+
+    async def save_wife(self, qq: str, wife: str, group: str, date: str) -> Tuple[str, bool]:
+        key = (qq, group, date)
+        pending = self._pending.get(key)
+        if pending is not None:
+            return pending, False
+        self._pending[key] = wife
+        self._ensure_task()
+        if len(self._pending) >= self.flush_batch_size:
+            self._wakeup.set()
+        return wife, True
+
+    async def get_group_today_wives(self, group: str, date: str, page: int, page_size: int) -> Tuple[List[Tuple[str, str]], int]:
+        # 管理查询较少，先写入再查询以保证分页结果完整
+        await self.flush()
+        return await self.db.get_group_today_wives(group, date, page, page_size)
+
+    async def get_group_all_wives(self, group: str, date: str) -> List[Tuple[str, str]]:
+        await self.flush()
+        return await self.db.get_group_all_wives(group, date)
+
+    async def upsert_wife(self, qq: str, wife: str, group: str, date: str) -> Optional[str]:
+        pending = self._pending.pop((qq, group, date), None)
+        previous = await self.db.upsert_wife(qq, wife, group, date)
+        return pending if pending is not None else previous
+
+    async def upsert_wives(self, records: List[Tuple[str, str, str, str]]) -> Tuple[int, int]:
+        # 先写入待写入的结果，批量修改才能正确统计更新和新建的条数
+        await self.flush()
+        return await self.db.upsert_wives(records)
+
+    async def get_active_groups(self, since: str) -> List[str]:
+        groups = set(await self.db.get_active_groups(since))
+        groups.update(group for _, group, date in self._pending if date >= since)
+        return sorted(groups)
+
+    async def archive_before(self, date: str) -> int:
+        await self.flush()
+        return await self.db.archive_before(date)
+
+    async def get_top_wives(self, group: str, since: Optional[str], limit: int) -> List[Tuple[str, int]]:
+        await self.flush()
+        return await self.db.get_top_wives(group, since, limit)
+
+    async def get_member_history(self, group: str, qq: str, limit: int) -> Optional[Dict[str, Any]]:
+        await self.flush()
+        return await self.db.get_member_history(group, qq, limit)
+
+    async def rebuild_stats(self):
+        await self.flush()
+        await self.db.rebuild_stats()
+
+    async def import_files(self, sources: List[Path]) -> int:
+        await self.flush()
+        return await self.db.import_files(sources)
+
+    async def close(self):
+        """停止后台任务，写入剩余结果后关闭数据库"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        await self.db.close()
 
 
 class JrlpAdminCommand(BaseCommand):
@@ -371,7 +3131,7 @@ class JrlpAdminCommand(BaseCommand):
             napcat_port = self.get_config("napcat.port")
 
             # 获取群成员信息
-            success, member_info = NapcatAPI.get_group_member_info(
+            success, member_info = await NapcatAPI.get_group_member_info(
                 napcat_address, napcat_port, group_id, user_id
             )
             if success:
@@ -381,33 +3141,75 @@ class JrlpAdminCommand(BaseCommand):
 
         return False, "none"
 
+    def _handle_stats(self) -> str:
+        """处理 stats 子命令"""
+        snapshot = JrlpContext.get(self.get_config).stats_snapshot()
+        lines = ["今日老婆插件统计："]
+        for stage, stats in snapshot["stages"].items():
+            lines.append(
+                f"{stage}: {stats['count']}次 错误{stats['errors']}次 "
+                f"p50 {stats['p50_ms']}ms p95 {stats['p95_ms']}ms p99 {stats['p99_ms']}ms"
+            )
+        if not snapshot["stages"]:
+            lines.append("暂无调用记录")
+        for name, label in (("today", "当天结果缓存"), ("nickname", "昵称缓存"), ("member_list", "群成员列表缓存"),
+                            ("avatar", "头像缓存")):
+            cache = snapshot["caches"][name]
+            lookups = cache["hits"] + cache["misses"]
+            hit_rate = cache["hits"] * 100 / lookups if lookups else 0.0
+            lines.append(f"{label}: 命中{cache['hits']}次 未命中{cache['misses']}次 命中率{hit_rate:.1f}%")
+        lines.append(f"合并的napcat请求: {snapshot['napcat']['coalesced']}次")
+        for target, reconnects in snapshot["napcat"]["ws_reconnects"].items():
+            lines.append(f"WebSocket {target}: 断线重连{reconnects}次")
+        queue = snapshot["send_queue"]
+        lines.append(
+            f"发送队列: 排队{queue['depth']}条 峰值{queue['peak_depth']}条 已发送{queue['sent']}条 "
+            f"合并{queue['coalesced']}条 队列满丢弃{queue['dropped']}条"
+        )
+        busiest = sorted(queue["groups"].items(), key=lambda item: item[1], reverse=True)[:3]
+        if busiest:
+            lines.append("积压最多的群: " + ", ".join(f"{group_id}({depth}条)" for group_id, depth in busiest))
+        opened = [name for name, state in snapshot["breakers"].items() if state != "closed"]
+        if opened:
+            lines.append(f"已熔断的接口: {', '.join(opened)}")
+        return "\n".join(lines)
+
+    async def _handle_reshard(self) -> str:
+        """处理 reshard 子命令"""
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
+        try:
+            copied, sources = await context.reshard()
+        except ValueError as e:
+            return f"迁移失败：{e}"
+        if not sources:
+            return "没有找到需要迁移的数据"
+        return f"已从 {', '.join(sources)} 迁移 {copied} 条记录到 {len(context.storage.shards)} 个分片"
+
     async def _handle_query(self, group_id: str, target_qq: str, user_id: str) -> str:
         """处理 query 子命令"""
         napcat_address = self.get_config("napcat.address")
         napcat_port = self.get_config("napcat.port")
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-
-        # 初始化数据库
-        current_dir = Path(__file__).parent.absolute()
-        db_path = current_dir / "jrlp.db"
-        db = JrlpDatabase(db_path)
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
+        db = context.db
 
         # 查询老婆
-        wife_qq = db.get_today_wife(target_qq, group_id, today)
+        wife_qq = await db.get_today_wife(target_qq, group_id, today)
+        if not wife_qq and context.roll_mode == "deterministic":
+            # 确定性模式下未被指定的成员按哈希计算结果
+            success, members = await context.member_lists.get_index(napcat_address, napcat_port, group_id)
+            if success:
+                wife_qq = context.deterministic_wife(group_id, target_qq, today, members)
         if not wife_qq:
             return f"该成员({target_qq})今日尚未抽取老婆"
 
         # 获取群成员昵称
-        success, member_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, target_qq)
-        member_name = "未知"
-        if success:
-            member_name = member_info.get("nickname", "未知")
+        member_name = await context.get_nickname(napcat_address, napcat_port, target_qq) or target_qq
 
         # 获取老婆昵称
-        success, wife_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, wife_qq)
-        wife_name = "未知"
-        if success:
-            wife_name = wife_info.get("nickname", "未知")
+        wife_name = await context.get_nickname(napcat_address, napcat_port, wife_qq) or wife_qq
 
         return f"{member_name}({target_qq})的老婆是{wife_name}({wife_qq})"
 
@@ -416,14 +3218,17 @@ class JrlpAdminCommand(BaseCommand):
         napcat_address = self.get_config("napcat.address")
         napcat_port = self.get_config("napcat.port")
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-
-        # 初始化数据库
-        current_dir = Path(__file__).parent.absolute()
-        db_path = current_dir / "jrlp.db"
-        db = JrlpDatabase(db_path)
-
-        # 分页查询
-        records, total = db.get_group_today_wives(group_id, today, page, QUERYALL_PAGE_SIZE)
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
+        db = context.db
+
+        # 分页查询，确定性模式下需要合并哈希计算的结果，在内存中分页
+        if context.roll_mode == "deterministic":
+            results = await context.get_group_today_results(napcat_address, napcat_port, group_id, today)
+            total = len(results)
+            records = results[(page - 1) * QUERYALL_PAGE_SIZE:page * QUERYALL_PAGE_SIZE]
+        else:
+            records, total = await db.get_group_today_wives(group_id, today, page, QUERYALL_PAGE_SIZE)
         if total == 0:
             return "该群今日暂无抽取记录"
 
@@ -433,77 +3238,266 @@ class JrlpAdminCommand(BaseCommand):
             return f"页码超出范围，共{total_pages}页"
 
         # 获取群信息
-        success, group_info = NapcatAPI.get_group_info(napcat_address, napcat_port, group_id)
-        group_name = "未知"
-        if success:
-            group_name = group_info.get("group_name", "未知")
+        group_name = await context.get_group_name(napcat_address, napcat_port, group_id)
 
         # 构建返回消息
         lines = [f"群{group_name}({group_id}) 的今日老婆有："]
 
         for qq, wife_qq in records:
             # 获取成员昵称
-            success, member_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, qq)
-            member_name = "未知"
-            if success:
-                member_name = member_info.get("nickname", "未知")
+            member_name = await context.get_nickname(napcat_address, napcat_port, qq) or qq
 
             # 获取老婆昵称
-            success, wife_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, wife_qq)
-            wife_name = "未知"
-            if success:
-                wife_name = wife_info.get("nickname", "未知")
+            wife_name = await context.get_nickname(napcat_address, napcat_port, wife_qq) or wife_qq
 
             lines.append(f"{member_name}({qq}) 的老婆是 {wife_name}({wife_qq})")
 
         lines.append(f"\n第{page}页/共{total_pages}页，共{total}项")
         return "\n".join(lines)
 
-    async def _handle_override(self, group_id: str, target_qq: str, wife_qq: str, user_id: str) -> str:
-        """处理 override 子命令"""
+    async def _handle_queryall_forward(self, group_id: str, user_id: str, private: bool) -> Optional[str]:
+        """以一条合并转发消息发送群今日的全部记录
+
+        Returns:
+            发送成功时返回None，否则返回需要回复的文本
+        """
         napcat_address = self.get_config("napcat.address")
         napcat_port = self.get_config("napcat.port")
         today = datetime.datetime.now().strftime("%Y-%m-%d")
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
 
-        # 初始化数据库
-        current_dir = Path(__file__).parent.absolute()
-        db_path = current_dir / "jrlp.db"
-        db = JrlpDatabase(db_path)
+        records = await context.get_group_today_results(napcat_address, napcat_port, group_id, today)
+        if not records:
+            return "该群今日暂无抽取记录"
 
-        # 获取管理员昵称
-        success, admin_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, user_id)
-        admin_name = "未知"
-        if success:
-            admin_name = admin_info.get("nickname", "未知")
+        group_name, names = await asyncio.gather(
+            context.get_group_name(napcat_address, napcat_port, group_id),
+            context.get_nicknames(napcat_address, napcat_port, group_id,
+                                  [qq for record in records for qq in record]),
+        )
+
+        # 每个节点放若干行，避免节点数超过客户端的显示上限
+        lines = [f"{names[qq]}({qq}) 的老婆是 {names[wife_qq]}({wife_qq})" for qq, wife_qq in records]
+        texts = [f"群{group_name}({group_id}) 的今日老婆，共{len(records)}项"]
+        texts.extend("\n".join(lines[i:i + QUERYALL_FORWARD_LINES])
+                     for i in range(0, len(lines), QUERYALL_FORWARD_LINES))
+        nodes = [
+            {"type": "node", "data": {"user_id": user_id, "nickname": "今日老婆",
+                                      "content": [{"type": "text", "data": {"text": text}}]}}
+            for text in texts
+        ]
 
-        # 获取群信息
-        success, group_info = NapcatAPI.get_group_info(napcat_address, napcat_port, group_id)
-        group_name = "未知"
-        if success:
-            group_name = group_info.get("group_name", "未知")
+        success, error = await NapcatAPI.send_forward_message(
+            napcat_address, napcat_port, nodes,
+            group_id=None if private else group_id, user_id=user_id
+        )
+        if not success:
+            logger.error(f"发送合并转发消息失败: {error}")
+            return f"发送合并转发消息失败: {error}"
+        return None
+
+    async def _handle_top(self, group_id: str, period: str) -> str:
+        """处理 top 子命令"""
+        napcat_address = self.get_config("napcat.address")
+        napcat_port = self.get_config("napcat.port")
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
+
+        if period == "all":
+            since, label = None, "历史"
+        else:
+            days = int(period)
+            since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+            label = f"近{days}天"
+
+        ranking = await context.db.get_top_wives(group_id, since, STATS_TOP_LIMIT)
+        if not ranking:
+            return f"该群{label}暂无抽取记录"
+
+        names = await context.get_nicknames(napcat_address, napcat_port, group_id, [qq for qq, _ in ranking])
+        lines = [f"{label}最受欢迎的群老婆："]
+        lines.extend(f"{rank}. {names[qq]}({qq}) 被抽中{count}次" for rank, (qq, count) in enumerate(ranking, start=1))
+        return "\n".join(lines)
+
+    async def _handle_history(self, group_id: str, target_qq: str) -> str:
+        """处理 history 子命令"""
+        napcat_address = self.get_config("napcat.address")
+        napcat_port = self.get_config("napcat.port")
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
+
+        history = await context.db.get_member_history(group_id, target_qq, 3)
+        if history is None:
+            return f"该成员({target_qq})在本群暂无抽取记录"
+
+        favorites = history["favorites"]
+        names = await context.get_nicknames(napcat_address, napcat_port, group_id,
+                                            [target_qq] + [qq for qq, _ in favorites])
+        lines = [f"{names[target_qq]}({target_qq}) 的今日老婆记录："]
+        if history["rolls"]:
+            lines.append(f"共抽取{history['rolls']}次（{history['first_date']} 至 {history['last_date']}）")
+        lines.append(f"被别人抽中{history['chosen']}次")
+        if favorites:
+            lines.append("最常抽到：" + "，".join(f"{names[qq]}({qq}) {count}次" for qq, count in favorites))
+        return "\n".join(lines)
+
+    async def _handle_override(self, group_id: str, target_qq: str, wife_qq: str, user_id: str) -> str:
+        """处理 override 子命令"""
+        napcat_address = self.get_config("napcat.address")
+        napcat_port = self.get_config("napcat.port")
+        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
+        db = context.db
 
         # 获取成员昵称
-        success, member_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, target_qq)
-        member_name = "未知"
-        if success:
-            member_name = member_info.get("nickname", "未知")
+        member_name = await context.get_nickname(napcat_address, napcat_port, target_qq) or target_qq
 
         # 获取老婆昵称
-        success, wife_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, wife_qq)
-        wife_name = "未知"
-        if success:
-            wife_name = wife_info.get("nickname", "未知")
+        wife_name = await context.get_nickname(napcat_address, napcat_port, wife_qq) or wife_qq
 
         # 更新或插入
-        is_update = db.upsert_wife(target_qq, wife_qq, group_id, today)
-        if is_update:
-            logger.info(f"{admin_name}({user_id}) 更新了 {group_name}({group_id}) 成员 {member_name}({target_qq}) 的老婆为 {wife_name}({wife_qq})")
-        else:
-            logger.info(f"{admin_name}({user_id}) 为 {group_name}({group_id}) 成员 {member_name}({target_qq}) 新建老婆记录为 {wife_name}({wife_qq})")
+        previous_wife = await db.upsert_wife(target_qq, wife_qq, group_id, today)
+        context.today_results.invalidate(group_id, [target_qq])
+
+        async def log_override():
+            # 审计日志需要的管理员昵称和群名在后台获取
+            admin_name = await context.get_nickname(napcat_address, napcat_port, user_id) or user_id
+            group_name = await context.get_group_name(napcat_address, napcat_port, group_id)
+            if previous_wife is not None:
+                logger.info(f"{admin_name}({user_id}) 更新了 {group_name}({group_id}) 成员 {member_name}({target_qq}) 的老婆为 {wife_name}({wife_qq})")
+            else:
+                logger.info(f"{admin_name}({user_id}) 为 {group_name}({group_id}) 成员 {member_name}({target_qq}) 新建老婆记录为 {wife_name}({wife_qq})")
+
+        context.side_tasks.submit(log_override)
 
         return f"已将{member_name}({target_qq})的老婆改为{wife_name}({wife_qq})"
 
+    @staticmethod
+    def _parse_pairs(args: List[str]) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """解析 成员QQ号:老婆QQ号 形式的参数，返回 (配对列表, 无法解析的参数)"""
+        pairs, invalid = [], []
+        for arg in args:
+            qq, sep, wife = arg.replace("：", ":").partition(":")
+            if sep:
+                pairs.append((qq.strip(), wife.strip()))
+            else:
+                invalid.append(arg)
+        return pairs, invalid
+
+    @staticmethod
+    def _load_import_file(path: Path) -> List[Tuple[str, str]]:
+        """读取导入文件中的 (成员QQ号, 老婆QQ号) 配对
+
+        - CSV：每行 成员QQ号,老婆QQ号，首行不是数字时视为表头跳过
+        - JSON：{"成员QQ号": "老婆QQ号", ...}，或 [[成员QQ号, 老婆QQ号], ...]，
+          或 [{"qq": 成员QQ号, "wife": 老婆QQ号}, ...]
+        """
+        text = path.read_text(encoding="utf-8-sig")
+        if path.suffix.lower() == ".csv":
+            rows = [row for row in csv.reader(io.StringIO(text)) if row and any(cell.strip() for cell in row)]
+            if rows and not rows[0][0].strip().isdigit():
+                rows = rows[1:]
+            return [(row[0].strip(), row[1].strip() if len(row) > 1 else "") for row in rows]
+
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return [(str(qq), str(wife)) for qq, wife in data.items()]
+        pairs = []
+        for item in data:
+            if isinstance(item, dict):
+                pairs.append((str(item.get("qq", "")), str(item.get("wife", ""))))
+            else:
+                pairs.append((str(item[0]), str(item[1]) if len(item) > 1 else ""))
+        return pairs
+
+    async def _handle_import(self, group_id: str, filename: str, user_id: str) -> str:
+        """处理 import 子命令，导入插件目录下的CSV/JSON文件"""
+        plugin_dir = Path(__file__).parent.absolute()
+        path = (plugin_dir / filename).resolve()
+        if plugin_dir.resolve() not in path.parents:
+            return "导入失败：只能导入插件目录下的文件"
+        if path.suffix.lower() not in (".csv", ".json"):
+            return "导入失败：只支持 .csv 和 .json 文件"
+        if not path.is_file():
+            return f"导入失败：找不到文件 {filename}"
+
+        loop = asyncio.get_running_loop()
+        try:
+            pairs = await loop.run_in_executor(None, self._load_import_file, path)
+        except (ValueError, TypeError, IndexError, KeyError, UnicodeDecodeError) as e:
+            return f"导入失败：文件格式错误: {e}"
+        return await self._handle_bulk_override(group_id, pairs, user_id, f"导入 {path.name}")
+
+    async def _handle_bulk_override(self, group_id: str, pairs: List[Tuple[str, str]], user_id: str,
+                                    source: str = "批量修改", skipped: Optional[List[str]] = None) -> str:
+        """批量指定老婆
+
+        只拉取一次群成员列表校验所有配对，合法的配对在一个事务中写入，
+        同一成员出现多次时以最后一次为准。
+        """
+        napcat_address = self.get_config("napcat.address")
+        napcat_port = self.get_config("napcat.port")
+        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
+        db = context.db
+
+        success, members = await context.member_lists.get_index(napcat_address, napcat_port, group_id)
+        if not success:
+            return f"{source}失败：无法获取群成员列表，未做任何修改: {members}"
+        if any(qq.isdigit() and wife.isdigit() and (qq not in members or wife not in members) for qq, wife in pairs):
+            # 缓存的成员列表可能还没有刚入群的成员，丢弃缓存重新拉取一次再校验
+            context.member_lists.invalidate(group_id)
+            refreshed, fresh = await context.member_lists.get_index(napcat_address, napcat_port, group_id)
+            if refreshed:
+                members = fresh
+
+        skipped = list(skipped or [])
+        valid: Dict[str, str] = {}
+        accepted = 0
+        for qq, wife in pairs:
+            if not qq.isdigit() or not wife.isdigit():
+                skipped.append(f"{qq}:{wife} 不是有效的QQ号")
+            elif qq not in members:
+                skipped.append(f"{qq}:{wife} 成员{qq}不在群内")
+            elif wife not in members:
+                skipped.append(f"{qq}:{wife} 老婆{wife}不在群内")
+            else:
+                accepted += 1
+                valid[qq] = wife
+
+        updated = created = 0
+        if valid:
+            records = [(qq, wife, group_id, today) for qq, wife in valid.items()]
+            updated, created = await db.upsert_wives(records)
+            context.today_results.invalidate(group_id, list(valid))
+
+            async def log_bulk_override():
+                admin_name = await context.get_nickname(napcat_address, napcat_port, user_id) or user_id
+                group_name = await context.get_group_name(napcat_address, napcat_port, group_id)
+                logger.info(f"{admin_name}({user_id}) 在 {group_name}({group_id}) {source}老婆记录 {len(records)} 条"
+                            f"（更新{updated}条，新建{created}条）")
+
+            context.side_tasks.submit(log_bulk_override)
+
+        lines = [f"{source}完成：更新{updated}条，新建{created}条"]
+        if accepted > len(valid):
+            lines.append(f"有{accepted - len(valid)}条重复的成员，以最后一条为准")
+        if skipped:
+            lines.append(f"跳过{len(skipped)}条：")
+            lines.extend(skipped[:BULK_OVERRIDE_REPORT_LIMIT])
+            if len(skipped) > BULK_OVERRIDE_REPORT_LIMIT:
+                lines.append(f"……等共{len(skipped)}条")
+        return "\n".join(lines)
+
     async def execute(self) -> Tuple[bool, Optional[str], bool]:
+        # 本命令内所有napcat调用共享一个总时限
+        with napcat_deadline(self.get_config("napcat.command_deadline", 15)):
+            return await self._execute()
+
+    async def _execute(self) -> Tuple[bool, Optional[str], bool]:
         # 获取用户信息
         user_info = self.message.message_info.user_info if self.message.message_info else None
         if not user_info:
@@ -524,7 +3518,15 @@ class JrlpAdminCommand(BaseCommand):
         chat_stream = self.message.chat_stream
         stream_type = chat_api.get_stream_type(chat_stream)
 
-        command = parts[1].lower()  # query/queryall/override
+        command = parts[1].lower()  # query/queryall/override/import/top/history/stats/rebuildstats/reshard
+
+        # stats/rebuildstats/reshard 不针对具体的群，仅机器人管理员可用
+        if command in ("stats", "rebuildstats", "reshard"):
+            has_permission, _ = await self._check_permission(user_id, None)
+            if not has_permission:
+                await self.send_text("权限不足")
+                return False, "权限不足", True
+            return await self._dispatch_global(command)
 
         if stream_type == "group":
             # 群聊模式：/jrlp <command> [args...]
@@ -538,6 +3540,10 @@ class JrlpAdminCommand(BaseCommand):
             group_id = parts[2]
             args = parts[3:]  # 第四个参数开始是功能参数
 
+        # 排行榜和个人记录在群聊中所有成员都可以查看
+        if command in ("top", "history") and stream_type == "group":
+            return await self._dispatch(command, group_id, args, user_id, stream_type)
+
         # 权限校验
         # 先检查机器人管理员权限（不需要群号）
         has_permission, permission_type = await self._check_permission(user_id, None)
@@ -552,7 +3558,7 @@ class JrlpAdminCommand(BaseCommand):
             napcat_address = self.get_config("napcat.address")
             napcat_port = self.get_config("napcat.port")
 
-            success, member_info = NapcatAPI.get_group_member_info(
+            success, member_info = await NapcatAPI.get_group_member_info(
                 napcat_address, napcat_port, group_id, user_id
             )
 
@@ -569,7 +3575,30 @@ class JrlpAdminCommand(BaseCommand):
             await self.send_text("权限不足")
             return False, "权限不足", True
 
+        return await self._dispatch(command, group_id, args, user_id, stream_type)
+
+    async def _dispatch_global(self, command: str) -> Tuple[bool, Optional[str], bool]:
+        # 执行不针对具体群的子命令
+        try:
+            if command == "stats":
+                result = self._handle_stats()
+            elif command == "rebuildstats":
+                context = JrlpContext.get(self.get_config)
+                context.ensure_started()
+                await context.db.rebuild_stats()
+                result = "统计表已按全部历史记录重建"
+            else:
+                result = await self._handle_reshard()
+            await self.send_text(result)
+            return True, "执行成功", True
+
+        except Exception as e:
+            logger.error(f"执行管理命令时发生错误: {str(e)}", exc_info=True)
+            await self.send_text(f"执行失败: {str(e)}")
+            return False, f"执行失败: {str(e)}", True
 
+    async def _dispatch(self, command: str, group_id: str, args: List[str], user_id: str,
+                        stream_type: str) -> Tuple[bool, Optional[str], bool]:
         # 根据命令分发处理
         try:
             if command == "query":
@@ -589,15 +3618,45 @@ class JrlpAdminCommand(BaseCommand):
                     except ValueError:
                         await self.send_text("参数错误：页码必须是数字")
                         return False, "参数错误", True
-                result = await self._handle_queryall(group_id, page, user_id)
+                if self.get_config("admin.queryall_forward", False):
+                    result = await self._handle_queryall_forward(group_id, user_id, stream_type != "group")
+                    if result is None:
+                        return True, "执行成功", True
+                else:
+                    result = await self._handle_queryall(group_id, page, user_id)
 
             elif command == "override":
-                if len(args) < 2:
-                    await self.send_text("参数错误：override需要指定群成员QQ号和老婆QQ号")
+                if args and any(":" in arg or "：" in arg for arg in args):
+                    # 批量模式：/jrlp override 成员QQ号:老婆QQ号 ...
+                    pairs, invalid = self._parse_pairs(args)
+                    skipped = [f"{arg} 格式应为 成员QQ号:老婆QQ号" for arg in invalid]
+                    result = await self._handle_bulk_override(group_id, pairs, user_id, skipped=skipped)
+                else:
+                    if len(args) < 2:
+                        await self.send_text("参数错误：override需要指定群成员QQ号和老婆QQ号")
+                        return False, "参数错误", True
+                    target_qq = args[0]
+                    wife_qq = args[1]
+                    result = await self._handle_override(group_id, target_qq, wife_qq, user_id)
+
+            elif command == "top":
+                period = args[0].lower() if args else "7"
+                if period not in ("7", "30", "all"):
+                    await self.send_text("参数错误：top的范围只能是 7、30 或 all")
                     return False, "参数错误", True
-                target_qq = args[0]
-                wife_qq = args[1]
-                result = await self._handle_override(group_id, target_qq, wife_qq, user_id)
+                result = await self._handle_top(group_id, period)
+
+            elif command == "history":
+                if len(args) < 1 or not args[0].isdigit():
+                    await self.send_text("参数错误：history需要指定群成员QQ号")
+                    return False, "参数错误", True
+                result = await self._handle_history(group_id, args[0])
+
+            elif command == "import":
+                if len(args) < 1:
+                    await self.send_text("参数错误：import需要指定插件目录下的文件名")
+                    return False, "参数错误", True
+                result = await self._handle_import(group_id, args[0], user_id)
 
             else:
                 await self.send_text("参数错误：未知的子命令")
@@ -619,6 +3678,11 @@ class JrlpCommand(BaseCommand):
     command_pattern = _load_command_pattern()  # 在类定义时动态加载配置
 
     async def execute(self) -> Tuple[bool, Optional[str], bool]:
+        # 本命令内所有napcat调用共享一个总时限
+        with napcat_deadline(self.get_config("napcat.command_deadline", 15)):
+            return await self._execute()
+
+    async def _execute(self) -> Tuple[bool, Optional[str], bool]:
         # 获取配置
         napcat_address = self.get_config("napcat.address")
         napcat_port = self.get_config("napcat.port")
@@ -634,94 +3698,140 @@ class JrlpCommand(BaseCommand):
 
         group_id = str(chat_stream.group_info.group_id)
         today = datetime.datetime.now().strftime("%Y-%m-%d")
+        context = JrlpContext.get(self.get_config)
+        context.ensure_started()
+        db = context.db
 
-        # 初始化数据库
-        current_dir = Path(__file__).parent.absolute()
-        db_path = current_dir / "jrlp.db"
-        db = JrlpDatabase(db_path)
+        # 已抽取用户重复发送命令时直接使用当天的缓存结果
+        generation = context.today_results.generation
+        cached = context.today_results.get(group_id, user_id, today)
+        if cached is not None:
+            return await self._reply_existing(context, group_id, user_id, today, generation, *cached)
 
-        # 查询今日是否已抽取
-        existing_wife = db.get_today_wife(user_id, group_id, today)
+        # 查询今日是否已抽取（确定性模式下只有管理员指定的记录）
+        existing_wife = await db.get_today_wife(user_id, group_id, today)
 
         if existing_wife:
-            # 已抽取过，获取老婆信息并返回
-            success, wife_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, existing_wife)
-            if not success:
-                logger.error(f"获取已抽取老婆信息失败: {wife_info}")
-                return False, f"获取信息失败: {wife_info}", True
+            return await self._reply_existing(context, group_id, user_id, today, generation, existing_wife)
 
-            wife_nickname = wife_info.get("nickname", "未知")
+        # 获取群成员索引（优先使用缓存）
+        success, members = await context.member_lists.get_index(napcat_address, napcat_port, group_id)
+        if not success:
+            logger.error(f"获取群成员列表失败: {members}")
+            return False, f"获取群成员列表失败: {members}", True
+
+        if context.roll_mode == "deterministic":
+            # 确定性模式：结果由哈希决定，当天重复计算结果不变，不写数据库
+            wife_id = context.deterministic_wife(group_id, user_id, today, members)
+            if wife_id is None:
+                logger.warning("群成员列表为空或只有自己")
+                return False, "找不到可用的群成员", True
+            if not context.mark_rolled(group_id, user_id, today):
+                return await self._reply_existing(context, group_id, user_id, today, generation, wife_id)
+        else:
+            # 随机选择老婆（排除自己）
+            wife_qq = members.sample(user_id)
+            if wife_qq is None:
+                logger.warning("群成员列表为空或只有自己")
+                return False, "找不到可用的群成员", True
+            wife_id = str(wife_qq)
+
+            # 保存到数据库，同一用户并发抽取时以先写入的结果为准
+            saved_wife, inserted = await db.save_wife(user_id, wife_id, group_id, today)
+            if not inserted:
+                return await self._reply_existing(context, group_id, user_id, today, generation, saved_wife)
+
+        # 获取老婆昵称（成员列表拉取时已写入昵称缓存）
+        wife_nickname = await context.get_nickname(napcat_address, napcat_port, wife_id) or members.card(wife_id)
+        context.today_results.put(group_id, user_id, today, wife_id, wife_nickname, generation)
+        wife_nickname = wife_nickname or wife_id
 
-            message = [
-                {"type": "at", "data": {"qq": user_id}},
-                {"type": "image", "data": {"file": f"https://q1.qlogo.cn/g?b=qq&nk={existing_wife}&s=640", "summary": "[图片]"}},
-                {"type": "text", "data": {"text": self.get_config("messages.already_rolled_text").format(wife_name=wife_nickname, wife_qq=existing_wife)}}
-            ]
+        # 发送消息
+        text = self.get_config("messages.new_roll_text").format(wife_name=wife_nickname, wife_qq=wife_id)
+        success, error = await self._send_result(context, group_id, user_id, wife_id, text)
 
-            success, error = NapcatAPI.send_group_message(napcat_address, napcat_port, group_id, message)
-            if not success:
-                logger.error(f"发送消息失败: {error}")
-                return False, f"发送消息失败: {error}", True
+        async def log_roll():
+            # 用户昵称和群名称只用于日志，在回复发出后于后台获取
+            user_nickname = members.card(user_id) or "未知"
+            group_name = await context.get_group_name(napcat_address, napcat_port, group_id)
+            logger.info(f"{user_nickname}({user_id}) 在 {group_name}({group_id}) 抽到了 {wife_nickname}({wife_id})")
 
-            return True, "已返回今日老婆", True
+        context.side_tasks.submit(log_roll)
 
-        # 获取群成员列表
-        success, member_list = NapcatAPI.get_group_member_list(napcat_address, napcat_port, group_id)
         if not success:
-            logger.error(f"获取群成员列表失败: {member_list}")
-            return False, f"获取群成员列表失败: {member_list}", True
-
-        # 过滤掉自己
-        candidates = [m for m in member_list if str(m.get("user_id")) != user_id]
-
-        if not candidates:
-            logger.warning("群成员列表为空或只有自己")
-            return False, "找不到可用的群成员", True
-
-        # 随机选择老婆
-        wife_data = random.choice(candidates)
-        wife_id = str(wife_data.get("user_id"))
+            logger.error(f"发送消息失败: {error}")
+            return False, f"发送消息失败: {error}", True
 
-        # 使用get_stranger_info获取老婆昵称
-        success, wife_info = NapcatAPI.get_stranger_info(napcat_address, napcat_port, wife_id)
-        if success:
-            wife_nickname = wife_info.get("nickname", "未知")
-        else:
-            wife_nickname = wife_data.get("card") or wife_data.get("nickname", "未知")
+        return True, "执行成功", True
 
-        # 保存到数据库
-        db.save_wife(user_id, wife_id, group_id, today)
+    async def _reply_existing(self, context: "JrlpContext", group_id: str, user_id: str, today: str,
+                              generation: int, wife_id: str,
+                              wife_nickname: Optional[str] = None) -> Tuple[bool, Optional[str], bool]:
+        """回复用户今日已抽取的老婆
 
-        # 获取用户昵称和群名称用于日志
-        user_nickname = "未知"
-        group_name = "未知"
+        Args:
+            generation: 查询结果之前取得的当天结果缓存 generation
+            wife_nickname: 缓存中的老婆昵称，None时重新获取
+        """
+        napcat_address = self.get_config("napcat.address")
+        napcat_port = self.get_config("napcat.port")
 
-        # 从成员列表中获取用户昵称
-        for member in member_list:
-            if str(member.get("user_id")) == user_id:
-                user_nickname = member.get("card") or member.get("nickname", "未知")
-                break
+        if wife_nickname is None:
+            wife_nickname = await context.get_nickname(napcat_address, napcat_port, wife_id)
+            context.today_results.put(group_id, user_id, today, wife_id, wife_nickname, generation)
+        # 昵称获取失败时降级为显示QQ号，不影响回复
+        wife_nickname = wife_nickname or wife_id
 
-        # 获取群信息
-        success, group_info = NapcatAPI.get_group_info(napcat_address, napcat_port, group_id)
-        if success:
-            group_name = group_info.get("group_name", "未知")
+        text = self.get_config("messages.already_rolled_text").format(wife_name=wife_nickname, wife_qq=wife_id)
+        success, error = await self._send_result(context, group_id, user_id, wife_id, text)
+        if not success:
+            logger.error(f"发送消息失败: {error}")
+            return False, f"发送消息失败: {error}", True
 
-        # 输出日志
-        logger.info(f"{user_nickname}({user_id}) 在 {group_name}({group_id}) 抽到了 {wife_nickname}({wife_id})")
+        return True, "已返回今日老婆", True
 
-        # 发送消息
+    async def _send_result(self, context: "JrlpContext", group_id: str, user_id: str, wife_id: str,
+                           text: str) -> Tuple[bool, Optional[str]]:
+        """发送 @用户 + 老婆头像 + 文本 的结果消息"""
+        if context.avatars is not None:
+            avatar = await context.avatars.get(wife_id)
+        else:
+            avatar = self.get_config("avatar.url_template", AVATAR_URL_TEMPLATE).format(
+                qq=wife_id, size=self.get_config("avatar.image_size", 640)
+            )
         message = [
             {"type": "at", "data": {"qq": user_id}},
-            {"type": "image", "data": {"file": f"https://q1.qlogo.cn/g?b=qq&nk={wife_id}&s=640", "summary": "[图片]"}},
-            {"type": "text", "data": {"text": self.get_config("messages.new_roll_text").format(wife_name=wife_nickname, wife_qq=wife_id)}}
+            {"type": "image", "data": {"file": avatar, "summary": "[图片]"}},
+            {"type": "text", "data": {"text": text}}
         ]
-        success, error = NapcatAPI.send_group_message(napcat_address, napcat_port, group_id, message)
-        if not success:
-            logger.error(f"发送消息失败: {error}")
-            return False, f"发送消息失败: {error}", True
+        if context.send_queue is not None:
+            # 经群发送队列限速，积压时与同群的其它抽取结果合并发送
+            return await context.send_queue.send(group_id, message, coalesce=True)
+        return await NapcatAPI.send_group_message(
+            self.get_config("napcat.address"), self.get_config("napcat.port"), group_id, message
+        )
 
-        return True, "执行成功", True
+
+class JrlpStartHandler(BaseEventHandler):
+    """机器人启动时启动插件的后台任务"""
+    event_type = EventType.ON_START
+    handler_name = "jrlp_start_handler"
+    handler_description = "今日老婆插件启动时的初始化"
+
+    async def execute(self, message) -> Tuple[bool, bool, Optional[str], None, None]:
+        JrlpContext.get(self.get_config).ensure_started()
+        return True, True, None, None, None
+
+
+class JrlpStopHandler(BaseEventHandler):
+    """机器人停止时写入未提交的数据并关闭数据库"""
+    event_type = EventType.ON_STOP
+    handler_name = "jrlp_stop_handler"
+    handler_description = "今日老婆插件停止时的清理"
+
+    async def execute(self, message) -> Tuple[bool, bool, Optional[str], None, None]:
+        await JrlpContext.shutdown()
+        return True, True, None, None, None
 
 
 # Plugin 类
@@ -737,16 +3847,34 @@ class JrlpPlugin(BasePlugin):
         "napcat": "napcat服务器配置",
         "messages": "消息文本配置",
         "command": "命令配置",
-        "admin": "管理功能配置"
+        "admin": "管理功能配置",
+        "cache": "缓存配置",
+        "database": "数据库配置",
+        "retention": "历史记录保留配置",
+        "stats": "性能统计配置",
+        "roll": "抽取方式配置",
+        "avatar": "头像缓存配置",
+        "background": "后台任务配置",
+        "send": "消息发送配置",
+        "prewarm": "预热配置"
     }
     config_schema = {
         "plugin": {
             "enabled": ConfigField(type=bool, default=True, description="是否启用插件"),
-            "config_version": ConfigField(type=str, default="1.1.5", description="配置版本")
+            "config_version": ConfigField(type=str, default="1.2.0", description="配置版本")
         },
         "napcat": {
             "address": ConfigField(type=str, default="napcat", description="napcat服务器连接地址"),
-            "port": ConfigField(type=int, default=3000, description="napcat服务器端口")
+            "port": ConfigField(type=int, default=3000, description="napcat服务器端口"),
+            "command_deadline": ConfigField(
+                type=float, default=15, description="单条命令内所有napcat调用的总时限（秒），超时后跳过剩余调用"
+            ),
+            "transport": ConfigField(
+                type=str, default="http",
+                description="与napcat通信的方式: http 每次调用发送HTTP请求, websocket 所有调用共用一条正向WebSocket长连接"
+            ),
+            "ws_port": ConfigField(type=int, default=3001, description="napcat正向WebSocket服务端口，transport为websocket时使用"),
+            "ws_path": ConfigField(type=str, default="/", description="napcat正向WebSocket服务路径")
         },
         "command": {
             "regex": ConfigField(
@@ -770,12 +3898,87 @@ class JrlpPlugin(BasePlugin):
         "admin": {
             "enabled": ConfigField(type=bool, default=True, description="是否启用管理功能"),
             "userlist": ConfigField(type=list, default=[], description="有管理权限的用户列表"),
-            "allow-group-admin": ConfigField(type=bool, default=False, description="是否允许群管理员和群主管理对应群的老婆记录")
+            "allow-group-admin": ConfigField(type=bool, default=False, description="是否允许群管理员和群主管理对应群的老婆记录"),
+            "queryall_forward": ConfigField(
+                type=bool, default=False, description="queryall 是否以一条合并转发消息发送当天全部记录（不再分页）"
+            )
+        },
+        "cache": {
+            "member_list_ttl": ConfigField(type=int, default=600, description="群成员列表缓存有效期（秒），超过后在后台刷新"),
+            "member_list_stale_ttl": ConfigField(type=int, default=3600, description="群成员列表缓存最长可用时间（秒），超过后必须重新拉取"),
+            "member_list_max_groups": ConfigField(type=int, default=64, description="最多缓存多少个群的成员列表，超出时淘汰最久未使用的群"),
+            "nickname_ttl": ConfigField(type=int, default=3600, description="QQ昵称缓存有效期（秒）"),
+            "nickname_max_size": ConfigField(type=int, default=8192, description="最多缓存多少个QQ昵称，超出时淘汰最久未使用的条目"),
+            "today_max_size": ConfigField(type=int, default=100000, description="当天抽取结果缓存的最大条数，跨天自动清空")
+        },
+        "database": {
+            "backend": ConfigField(
+                type=str, default="sqlite",
+                description="存储方式：sqlite 单个 jrlp.db 文件；sharded 按群号分散到多个SQLite文件；memory 纯内存（重启后数据丢失，仅用于测试）"
+            ),
+            "shards": ConfigField(type=int, default=8, description="sharded 存储的分片数，修改后需要执行 /jrlp reshard 迁移数据"),
+            "reader_threads": ConfigField(type=int, default=2, description="数据库读线程数，写操作固定在单独的写线程上执行"),
+            "write_behind": ConfigField(type=bool, default=False, description="是否延迟批量写入抽取结果，开启后结果先保存在内存中再定期合并提交"),
+            "flush_interval": ConfigField(type=float, default=1.0, description="延迟写入模式下的最长提交间隔（秒）"),
+            "flush_batch_size": ConfigField(type=int, default=200, description="延迟写入模式下积压多少条结果时立即提交")
+        },
+        "retention": {
+            "enabled": ConfigField(type=bool, default=True, description="是否定期把旧记录移入归档表"),
+            "hot_days": ConfigField(type=int, default=7, description="主表保留最近多少天的记录（含当天）"),
+            "interval_hours": ConfigField(type=int, default=24, description="归档检查间隔（小时）")
+        },
+        "stats": {
+            "dump_interval": ConfigField(type=int, default=0, description="定期把统计数据写入 jrlp_stats.json 的间隔（秒），0表示不写入")
+        },
+        "roll": {
+            "mode": ConfigField(
+                type=str,
+                default="random",
+                description="抽取方式：random 随机抽取并保存结果；deterministic 由 (用户, 群, 日期) 的哈希决定结果，不写数据库"
+            ),
+            "secret": ConfigField(type=str, default="", description="deterministic 模式的哈希密钥，留空则自动生成并保存在数据库中")
+        },
+        "avatar": {
+            "enabled": ConfigField(type=bool, default=True, description="是否把老婆头像缓存在插件目录下，发送时不再让napcat下载"),
+            "send_mode": ConfigField(
+                type=str, default="base64",
+                description="缓存头像的发送方式：base64 通用；file 发送本地文件路径，仅napcat与机器人在同一台机器上时可用"
+            ),
+            "image_size": ConfigField(type=int, default=640, description="头像尺寸，可选 40/100/140/640"),
+            "max_size_mb": ConfigField(type=int, default=64, description="头像缓存的最大总大小（MB），超出时淘汰最久未使用的头像"),
+            "ttl_hours": ConfigField(type=int, default=24, description="头像缓存有效期（小时），过期后重新下载"),
+            "url_template": ConfigField(
+                type=str, default=AVATAR_URL_TEMPLATE, description="头像下载地址，{qq}为QQ号，{size}为图片尺寸"
+            )
+        },
+        "background": {
+            "queue_size": ConfigField(type=int, default=256, description="日志补全等后台任务的队列长度，满了以后丢弃最早的任务")
+        },
+        "send": {
+            "enabled": ConfigField(type=bool, default=True, description="是否通过按群的发送队列限速发送抽取结果"),
+            "rate": ConfigField(type=float, default=1.0, description="每个群每秒最多发送的消息数，0表示不限速"),
+            "burst": ConfigField(type=int, default=5, description="每个群允许连续发送的消息数"),
+            "queue_size": ConfigField(type=int, default=100, description="每个群最多排队的消息数，满了以后新的回复发送失败"),
+            "coalesce_threshold": ConfigField(type=int, default=3, description="某个群积压多少条消息时开始合并抽取结果"),
+            "coalesce_max": ConfigField(type=int, default=10, description="最多把多少条抽取结果合并成一条消息")
+        },
+        "prewarm": {
+            "enabled": ConfigField(type=bool, default=True, description="是否在启动时和每天零点前预先拉取活跃群的成员列表和群信息"),
+            "lead_seconds": ConfigField(type=int, default=120, description="零点前多少秒开始预热"),
+            "active_days": ConfigField(type=int, default=3, description="最近多少天内有抽取记录的群视为活跃群"),
+            "concurrency": ConfigField(type=int, default=4, description="预热时同时拉取的群数")
         }
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 插件加载时创建共享的数据库和缓存
+        JrlpContext.get(self.get_config)
+
     def get_plugin_components(self) -> List[Tuple[ComponentInfo, Type]]:
         return [
             (JrlpCommand.get_command_info(), JrlpCommand),
-            (JrlpAdminCommand.get_command_info(), JrlpAdminCommand)
+            (JrlpAdminCommand.get_command_info(), JrlpAdminCommand),
+            (JrlpStartHandler.get_handler_info(), JrlpStartHandler),
+            (JrlpStopHandler.get_handler_info(), JrlpStopHandler)
         ]